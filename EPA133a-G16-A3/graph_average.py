@@ -1,8 +1,11 @@
+import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# read the csv file
-df1 = pd.read_csv('output/all_scenarios.csv')
+# read the averages per scenario from the results database
+connection = sqlite3.connect('output/results.sqlite')
+df1 = pd.read_sql_query('SELECT * FROM scenarios', connection)
+connection.close()
 
 print(df1)
 
@@ -1,18 +1,19 @@
 
+import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# read CSV as dataframe
-def graph_output(file_name):
-    df_non_transposed = pd.read_csv(file_name)
-    # Transpose theDataFrame
-    df = df_non_transposed.transpose()
-    # put the first row as column names
-    df.columns = df.iloc[0]
-    # delete the first row, as they are now the column names
-    df = df[1:]
+# read the runs of one scenario of the latest batch from the results database as dataframe, one row per seed,
+# without the runs that are not in the averages of the scenario
+def graph_output(scenario, file_name='output/results.sqlite'):
+    connection = sqlite3.connect(file_name)
+    df = pd.read_sql_query('SELECT seed, "Average Travel Time", "Average Waiting Time" FROM runs '
+                           'WHERE scenario = ? AND batch = (SELECT MAX(batch) FROM runs) AND used IS NOT 0 '
+                           'ORDER BY seed',
+                           connection, params=(scenario,))
+    connection.close()
     # rename the columns
-    df_new = df.rename(columns={'Index': 'Seed', 'Average Travel Time': 'Average_Travel_Time', 'Average Waiting Time': 'Average_Waiting_Time'})
+    df_new = df.rename(columns={'seed': 'Seed', 'Average Travel Time': 'Average_Travel_Time', 'Average Waiting Time': 'Average_Waiting_Time'})
 
     print(df_new)
 
@@ -36,14 +37,14 @@ def graph_output(file_name):
     plt.grid(True)
     plt.show()
 
-graph_output('output/scenario_0.csv')
-# graph_output('output/scenario_1.csv')
-# graph_output('output/scenario_2.csv')
-# graph_output('output/scenario_3.csv')
-# graph_output('output/scenario_4.csv')
-# graph_output('output/scenario_5.csv')
-# graph_output('output/scenario_6.csv')
-# graph_output('output/scenario_7.csv')
-# graph_output('output/scenario_8.csv')
+graph_output(0)
+# graph_output(1)
+# graph_output(2)
+# graph_output(3)
+# graph_output(4)
+# graph_output(5)
+# graph_output(6)
+# graph_output(7)
+# graph_output(8)
 
 
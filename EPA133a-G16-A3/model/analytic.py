@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+from components import Source
+from events import DiscreteEventVehicles
+from model import BangladeshModel
+from montecarlo import delay_classes, expected_delays
+from routes import Route
+from run_control import half_width
+
+
+# ---------------------------------------------------------------
+class ExpectedTravelTime:
+    """
+    Computes the expected averages of a scenario in closed form, without simulating or sampling
+
+    break_bridges breaks int(p / 100 * n) of the n bridges of a condition, drawn
+    uniformly, so each of them is broken with probability int(p / 100 * n) / n.
+    By linearity of expectation, the expected waiting time of a route is the sum over
+    its bridges of that probability times the expected delay of Bridge.get_delay_time
+    (see montecarlo.expected_delays). The expected travel time of a route is its driving
+    ticks without broken bridges (DiscreteEventVehicles.drive_ticks), plus for each bridge
+    the probability times the extra ticks of a stop there: the change of the driving
+    ticks when the drive is split at the bridge, and E[ceil(delay)] - 1 = E[delay] - 1/2.
+    The extra ticks of two broken bridges on one route are taken as independent, which
+    is off by at most a tick per pair.
+
+    The averages over the trips weigh each route with the rate of its trucks: one truck
+    every generation_frequency ticks per source, with a sink drawn uniformly from the
+    reachable sinks as in get_random_route. Over a run of run_length ticks, a truck is
+    only counted if it reaches its sink in time, so the routes are weighted with the
+    ticks in which a truck can be generated and still finish, run_length minus the
+    expected travel time of the route. The censoring of the slowest trips within a
+    route is ignored, which overestimates the averages slightly for scenarios with
+    long delays.
+
+    Attributes
+    __________
+    model: BangladeshModel
+        the model whose Infra and route table are used to compile the routes; its broken bridges are not used
+
+    routes: list
+        the compiled Route of every reachable source/sink pair
+
+    rates: ndarray
+        the expected number of trucks per tick on each route
+
+    base_ticks: ndarray (int)
+        the driving ticks of each route without broken bridges
+
+    conditions: ndarray
+        the condition of each bridge in model.bridges
+    """
+
+    def __init__(self, model):
+        self.model = model
+        bridges = model.bridges
+        self.conditions = np.array([bridge.condition for bridge in bridges], dtype=object)
+        self._names, self._codes = np.unique(self.conditions.astype(str), return_inverse=True)
+        self._counts = np.bincount(self._codes, minlength=len(self._names))
+        self._delays = expected_delays[delay_classes([bridge.length for bridge in bridges])]
+        bridge_number = {model.infra_index[bridge.unique_id]: number for number, bridge in enumerate(bridges)}
+
+        self.routes = []
+        rates = []
+        base_ticks = []
+        # one entry per bridge on each route: the route number, the bridge number and the extra driving ticks
+        pair_routes = []
+        pair_bridges = []
+        pair_ticks = []
+        for source in (agent for agent in model.infra if isinstance(agent, Source)):
+            sinks = sorted(model.route_table.reachable_sinks(source.unique_id))
+            routes = [Route(model, model.route_table.get(source.unique_id, sink)) for sink in sinks]
+            routes = [route for route in routes if len(route) >= 2]
+            for route in routes:
+                sink = len(route) - 1
+                ticks = DiscreteEventVehicles.drive_ticks(route, 0.0, sink)[0]
+                for position in route.stops:
+                    if position == sink:
+                        continue
+                    split = DiscreteEventVehicles.drive_ticks(route, 0.0, position)[0] + \
+                        DiscreteEventVehicles.drive_ticks(route, route.cum_start(position), sink)[0]
+                    pair_routes.append(len(self.routes))
+                    pair_bridges.append(bridge_number[route.indices[position]])
+                    pair_ticks.append(split - ticks)
+                self.routes.append(route)
+                rates.append(1 / (source.generation_frequency * len(routes)))
+                base_ticks.append(ticks)
+
+        self.rates = np.array(rates)
+        self.base_ticks = np.array(base_ticks, dtype=np.int64)
+        self._pair_routes = np.array(pair_routes, dtype=np.int64)
+        self._pair_bridges = np.array(pair_bridges, dtype=np.int64)
+        self._pair_ticks = np.array(pair_ticks, dtype=float)
+
+    def probabilities(self, scenario_dict):
+        """
+        The probability that each bridge is broken in a scenario
+        """
+        amounts = np.array([int((scenario_dict.get(name, 0) / 100) * count)
+                            for name, count in zip(self._names.tolist(), self._counts.tolist())])
+        return (amounts / np.maximum(self._counts, 1))[self._codes]
+
+    def expected_routes(self, scenario_dict):
+        """
+        The expected travel time, waiting time and number of broken bridges of each route
+        """
+        broken = self.probabilities(scenario_dict)[self._pair_bridges]
+        count = len(self.routes)
+        waiting_time = np.bincount(self._pair_routes, weights=broken * self._delays[self._pair_bridges],
+                                   minlength=count)
+        extra_ticks = np.bincount(self._pair_routes, weights=broken * (self._pair_ticks - 0.5),
+                                  minlength=count)
+        broken_bridges = np.bincount(self._pair_routes, weights=broken, minlength=count)
+        return self.base_ticks + extra_ticks + waiting_time, waiting_time, broken_bridges
+
+    def route_data(self, scenario_dict):
+        """
+        The expected travel and waiting time of each route of a scenario, one row per origin/destination pair
+        """
+        travel_time, waiting_time, broken_bridges = self.expected_routes(scenario_dict)
+        return pd.DataFrame({
+            'origin': [route.infra[0].unique_id for route in self.routes],
+            'destination': [route.infra[-1].unique_id for route in self.routes],
+            'Length': [route.cum_start(len(route) - 1) for route in self.routes],
+            'Trucks per Tick': self.rates,
+            'Broken Bridges': broken_bridges,
+            'Expected Travel Time': travel_time,
+            'Expected Waiting Time': waiting_time,
+        })
+
+    def expected(self, scenario_dict, run_length=7200):
+        """
+        The expected averages of a run of a scenario, in the format of BangladeshModel.get_data
+
+        run_length: the ticks of the run; None for the averages over all trips of an endless run
+        """
+        travel_time, waiting_time, _ = self.expected_routes(scenario_dict)
+        if run_length is None:
+            weights = self.rates
+        else:
+            weights = self.rates * np.maximum(run_length - travel_time, 0)
+        data_dict = {'Average Travel Time': np.average(travel_time, weights=weights),
+                     'Average Waiting Time': np.average(waiting_time, weights=weights)}
+        if run_length is not None:
+            data_dict['Trucks'] = weights.sum()
+        return pd.Series(data_dict)
+
+    def screen(self, scenario_list, run_length=7200):
+        """
+        The expected averages of every scenario of a list, as in all_scenarios.csv
+        """
+        data = [self.expected(scenario_dict, run_length) for scenario_dict in scenario_list]
+        return pd.DataFrame({'Scenario': np.arange(len(scenario_list)),
+                             'Average Travel Time': [row['Average Travel Time'] for row in data],
+                             'Average Waiting Time': [row['Average Waiting Time'] for row in data]})
+
+    def validate(self, scenario_list, seeds, run_length=7200, engine='event'):
+        """
+        Compare the expected averages of each scenario with the averages of simulated replications,
+        with the half-widths of the 95% confidence intervals of the simulated averages
+        """
+        rows = []
+        for index, scenario_dict in enumerate(scenario_list):
+            simulated = []
+            for seed in seeds:
+                model = BangladeshModel(seed=seed, scen_dict=scenario_dict, engine=engine,
+                                        network=self.model.network)
+                model.run(run_length)
+                data = model.get_data()
+                simulated.append((data.iloc[0, 0], data.iloc[1, 0]))
+            simulated = np.array(simulated, dtype=float)
+            expected = self.expected(scenario_dict, run_length)
+            rows.append({'Scenario': index,
+                         'Expected Travel Time': expected['Average Travel Time'],
+                         'Simulated Travel Time': simulated[:, 0].mean(),
+                         'Travel Time Half Width': half_width(simulated[:, 0]),
+                         'Expected Waiting Time': expected['Average Waiting Time'],
+                         'Simulated Waiting Time': simulated[:, 1].mean(),
+                         'Waiting Time Half Width': half_width(simulated[:, 1])})
+        return pd.DataFrame(rows)
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,23 @@
+import os
+
+
+# ---------------------------------------------------------------
+def atomic_write(file_name, write):
+    """
+    Write a file in one step: write(file) writes the contents to a temporary file in the same folder,
+    which then replaces file_name, so an interrupted write never leaves a broken file behind and
+    the file is never read while it is being written
+
+    The temporary file is named by the process id, so workers that write the same file do not clash.
+    """
+    temporary_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    try:
+        with open(temporary_file_name, 'wb') as file:
+            write(file)
+        os.replace(temporary_file_name, file_name)
+    except BaseException:
+        if os.path.exists(temporary_file_name):
+            os.remove(temporary_file_name)
+        raise
+
+# EOF -----------------------------------------------------------
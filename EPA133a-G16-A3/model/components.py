@@ -1,5 +1,6 @@
 from mesa import Agent
 from enum import Enum
+from bisect import bisect_right
 
 
 # ---------------------------------------------------------------
@@ -34,6 +35,14 @@ class Infra(Agent):
         return type(self).__name__ + str(self.unique_id)
 
 
+# The delay at a broken bridge by length class: the largest length of the class in meters, and the
+# method of Random and its parameters that draw the delay (triangular(low, high, mode))
+delay_table = ((10, 'uniform', (10, 20)),
+               (50, 'uniform', (15, 60)),
+               (200, 'uniform', (45, 90)),
+               (float('inf'), 'triangular', (60, 240, 120)))
+
+
 # ---------------------------------------------------------------
 class Bridge(Infra):
     """
@@ -46,6 +55,10 @@ class Bridge(Infra):
 
     delay_time: int
         the delay (in ticks) caused by this bridge
+
+    delay_random: Random
+        the random number generator of the delays at this bridge, see BangladeshModel.delay_stream;
+        set at the first delay
     ...
 
     """
@@ -56,6 +69,7 @@ class Bridge(Infra):
 
         self.condition = condition
         self.broken = False
+        self.delay_random = None
 
         # TODO
         self.delay_time = self.random.randrange(0, 10)
@@ -74,14 +88,13 @@ class Bridge(Infra):
         """
         # If the bridge is flagged, determine the delay_time, otherwise delay_time is 0
         if self.broken == True:
-            if self.length > 200:
-                delay_time = self.random.triangular(60, 240, 120)
-            elif self.length > 50 and self.length <= 200:
-                delay_time = self.random.uniform(45, 90)
-            elif self.length > 10 and self.length <= 50:
-                delay_time = self.random.uniform(15, 60)
-            else:
-                delay_time = self.random.uniform(10, 20)
+            if self.delay_random is None:
+                self.delay_random = self.model.delay_stream(self)
+            # the first length class whose limit the bridge does not exceed (an unknown length is the shortest)
+            for limit, distribution, parameters in delay_table:
+                if not self.length > limit:
+                    break
+            delay_time = getattr(self.delay_random, distribution)(*parameters)
 
         else:
             delay_time = 0
@@ -157,10 +170,17 @@ class Source(Infra):
         Generates a truck, sets its path, increases the global and local counters
         """
         try:
+            route = self.model.get_route(self.unique_id)
+            if len(route) == 0:
+                # No sink can be reached from this source
+                self.vehicle_generated_flag = False
+                return
             agent = Vehicle('Truck' + str(Source.truck_counter), self.model, self)
             if agent:
                 self.model.schedule.add(agent)
-                agent.set_path()
+                agent.set_path(route)
+                agent.number = self.model.trucks_generated
+                self.model.trucks_generated += 1
                 Source.truck_counter += 1
                 self.vehicle_count += 1
                 self.vehicle_generated_flag = True
@@ -205,6 +225,15 @@ class Vehicle(Agent):
         the whole path (origin and destination) where the vehicle shall drive
         It consists the Infras' uniques IDs in a sequential order
 
+    route: Route
+        the compiled path, see routes.py
+
+    route_offset: float
+        the distance in meters driven from the start of the route
+
+    number: int
+        the order in which the vehicle is generated in the run
+
     location_index: int
         a pointer to the current Infra in "path_ids" (above)
         i.e. the id of self.location is self.path_ids[self.location_index]
@@ -243,6 +272,9 @@ class Vehicle(Agent):
         self.location_offset = location_offset
         self.pos = generated_by.pos
         self.path_ids = path_ids
+        self.route = None
+        self.route_offset = location_offset
+        self.number = None
         # default values
         self.state = Vehicle.State.DRIVE
         self.location_index = 0
@@ -261,11 +293,14 @@ class Vehicle(Agent):
                " " + str(self.state) + '(' + str(self.waiting_time) + ') ' + \
                str(self.location) + '(' + str(self.location.vehicle_count) + ') ' + str(self.location_offset)
 
-    def set_path(self):
+    def set_path(self, route=None):
         """
         Set the origin destination path of the vehicle
         """
-        self.path_ids = self.model.get_route(self.generated_by.unique_id)
+        if route is None:
+            route = self.model.get_route(self.generated_by.unique_id)
+        self.route = route
+        self.path_ids = self.route.path_ids
         #print("path_ids", self.path_ids)
 
     def step(self):
@@ -294,64 +329,66 @@ class Vehicle(Agent):
         # the distance that vehicle drives in a tick
         # speed is global now: can change to instance object when individual speed is needed
         distance = Vehicle.speed * Vehicle.step_time
-        distance_rest = self.location_offset + distance - self.location.length
+        self.route_offset += distance
 
-        if distance_rest > 0:
+        if self.route_offset > self.route.cum_end[self.location_index]:
             # go to the next object
-            self.drive_to_next(distance_rest)
+            self.drive_to_next()
         else:
             # remain on the same object
             self.location_offset += distance
 
-    def drive_to_next(self, distance):
+    def drive_to_next(self):
         """
-        vehicle shall move to the next object with the given distance
+        vehicle shall move to the object where its route_offset ends up,
+        unless it has to stop at a bridge or sink on the way
         """
+        route = self.route
+        # the first object ahead that ends beyond the route_offset
+        next_index = bisect_right(route.cum_end, self.route_offset, self.location_index + 1)
+
+        # the bridges and the sink passed in this tick, in order
+        stop = bisect_right(route.stops, self.location_index)
+        while stop < len(route.stops) and route.stops[stop] <= next_index:
+            stop_index = route.stops[stop]
+            next_infra = route.infra[stop_index]
+
+            if isinstance(next_infra, Sink):
+                # arrive at the sink
+                self.arrive_at_next(stop_index, 0)
+
+                # When a vehicle has reached a sink, its data is considered for data collection
+                # which is a more efficient, and more accurate, way to calculate averages
+                self.model.record_trip(self.number, route, self.travel_time, self.waiting_time_agent)
+
+                self.removed_at_step = self.model.schedule.steps
+                self.location.remove(self)
+                return
 
-        self.location_index += 1
-        #print(self.location_index)
-        #print(self)
-        next_id = self.path_ids[self.location_index]
-        next_infra = self.model.schedule._agents[next_id]  # Access to protected member _agents
-        next_infra = self.model.schedule._agents[next_id]  # Access to protected member _agents
-
-        if isinstance(next_infra, Sink):
-            # arrive at the sink
-            self.arrive_at_next(next_infra, 0)
-
-            # When a vehicle has reached a sink, its data is considered for data collection
-            # which is a more efficient, and more accurate, way to calculate averages
-            self.model.total_travel_time.append(self.travel_time)
-            self.model.total_waiting_time.append(self.waiting_time_agent)
-            self.model.trucks_sink_counter += 1
-
-            self.removed_at_step = self.model.schedule.steps
-            self.location.remove(self)
-            return
-
-        elif isinstance(next_infra, Bridge):
             self.waiting_time = Bridge.get_delay_time(next_infra)
             self.waiting_time_agent += self.waiting_time
+            # attribute the crossing and the delay to the bridge
+            self.model.bridge_delays.cross(route.indices[stop_index])
+            self.model.record_wait(self.number, route.indices[stop_index], self.waiting_time)
             if self.waiting_time > 0:
                 # arrive at the bridge and wait
-                self.arrive_at_next(next_infra, 0)
+                self.route_offset = route.cum_start(stop_index)
+                self.arrive_at_next(stop_index, 0)
                 self.state = Vehicle.State.WAIT
                 return
             # else, continue driving
+            stop += 1
 
-        if next_infra.length > distance:
-            # stay on this object:
-            self.arrive_at_next(next_infra, distance)
-        else:
-            # drive to next object:
-            self.drive_to_next(distance - next_infra.length)
+        # stay on this object:
+        self.arrive_at_next(next_index, self.route_offset - route.cum_start(next_index))
 
-    def arrive_at_next(self, next_infra, location_offset):
+    def arrive_at_next(self, next_index, location_offset):
         """
-        Arrive at next_infra with the given location_offset
+        Arrive at the Infra at next_index in the route with the given location_offset
         """
         self.location.vehicle_count -= 1
-        self.location = next_infra
+        self.location_index = next_index
+        self.location = self.route.infra[next_index]
         self.location_offset = location_offset
         self.location.vehicle_count += 1
 
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from components import Bridge
+from events import DiscreteEventVehicles
+from montecarlo import delay_classes, draw_delays
+
+
+# ---------------------------------------------------------------
+class Counterfactual:
+    """
+    Re-evaluates a finished run as if one more bridge had been broken, without simulating again
+
+    Trucks never interact, so breaking bridge X only changes the trips whose route
+    crosses X. For such a trip, the driving ticks of the segment between the broken
+    stops around X are recomputed with X as an extra stop (DiscreteEventVehicles.drive_ticks),
+    and a delay at X is drawn from the distribution of Bridge.get_delay_time; the other
+    delays of the trip stay as they were. A trip that would then finish after the end of
+    the run is no longer counted. All bridges on the routes of the logged trips are
+    evaluated in one pass, one vectorized batch of delays per route.
+
+    The model must have been run with its trip log on (see BangladeshModel.log_trips).
+
+    Attributes
+    __________
+    model: BangladeshModel
+        the finished run
+
+    end: int
+        the tick at which the run ended; trips are counted if they finish before it
+
+    routes: dict
+        Key: (origin, destination)
+        Value: the compiled Route of the logged trips between them
+    """
+
+    def __init__(self, model):
+        if model.trip_log is None:
+            raise ValueError("The model has no trip log, call model.log_trips() before the run")
+        self.model = model
+        self.end = model.schedule.steps
+        self.routes = {(route.infra[0].unique_id, route.infra[-1].unique_id): route
+                       for route in model.path_ids_dict.values() if len(route) >= 2}
+
+        trips = model.trip_log.get_trips()
+        self.generated_at_step = trips['generated_at_step']
+        self.travel_time = trips['removed_at_step'] - trips['generated_at_step']
+        self.waiting_time = trips['waiting_time']
+        # the logged trips per route
+        keys = list(zip(trips['source'].tolist(), trips['sink'].tolist()))
+        self._trips = {}
+        for trip, key in enumerate(keys):
+            self._trips.setdefault(key, []).append(trip)
+
+    def evaluate(self, bridge_ids=None, rng=None):
+        """
+        The averages of the run as if each bridge had also been broken, one row per bridge,
+        ordered by the increase of the Average Travel Time
+
+        bridge_ids: the bridges to evaluate; all bridges that are not broken if None
+        """
+        model = self.model
+        rng = np.random.default_rng(rng)
+        if bridge_ids is not None:
+            selected = np.zeros(len(model.infra), dtype=bool)
+            selected[[model.infra_index[bridge_id] for bridge_id in bridge_ids]] = True
+
+        size = len(model.infra)
+        affected = np.zeros(size, dtype=np.int64)
+        lost = np.zeros(size, dtype=np.int64)
+        travel_change = np.zeros(size)
+        waiting_change = np.zeros(size)
+
+        for key, trips in self._trips.items():
+            route = self.routes[key]
+            trips = np.array(trips, dtype=np.int64)
+            candidates, ticks = self._candidates(route)
+            if bridge_ids is not None:
+                keep = selected[route.indices[candidates]]
+                candidates, ticks = candidates[keep], ticks[keep]
+            if len(candidates) == 0:
+                continue
+
+            indices = route.indices[candidates]
+            classes = delay_classes([route.infra[position].length for position in candidates.tolist()])
+            delays = draw_delays(np.repeat(classes, len(trips)), rng).reshape(len(candidates), len(trips))
+
+            travel_time = self.travel_time[trips]
+            new_travel_time = travel_time[None, :] + ticks[:, None] + np.ceil(delays) - 1
+            new_waiting_time = self.waiting_time[trips][None, :] + delays
+            finished = self.generated_at_step[trips][None, :] + new_travel_time <= self.end - 1
+
+            # the change of the totals: the trips that still finish count with their new times,
+            # the others are no longer counted
+            affected[indices] += len(trips)
+            lost[indices] += (~finished).sum(axis=1)
+            travel_change[indices] += np.where(finished, new_travel_time, 0).sum(axis=1) - travel_time.sum()
+            waiting_change[indices] += np.where(finished, new_waiting_time, 0).sum(axis=1) - \
+                self.waiting_time[trips].sum()
+
+        if bridge_ids is None:
+            evaluated = [index for index, agent in enumerate(model.infra)
+                         if isinstance(agent, Bridge) and not agent.broken]
+        else:
+            evaluated = [model.infra_index[bridge_id] for bridge_id in bridge_ids]
+        evaluated = np.array(evaluated, dtype=np.int64)
+
+        count = len(self.travel_time)
+        travel_total = self.travel_time.sum()
+        waiting_total = self.waiting_time.sum()
+        trucks = count - lost[evaluated]
+        df = pd.DataFrame({
+            'id': [model.infra[index].unique_id for index in evaluated.tolist()],
+            'road': [model.infra[index].road_name for index in evaluated.tolist()],
+            'condition': [model.infra[index].condition for index in evaluated.tolist()],
+            'trips_affected': affected[evaluated],
+            'Average Travel Time': (travel_total + travel_change[evaluated]) / trucks,
+            'Average Waiting Time': (waiting_total + waiting_change[evaluated]) / trucks,
+            'Trucks': trucks,
+        })
+        df['Travel Time Increase'] = df['Average Travel Time'] - travel_total / count
+        df['Waiting Time Increase'] = df['Average Waiting Time'] - waiting_total / count
+        return df.sort_values('Travel Time Increase', ascending=False, kind='stable').reset_index(drop=True)
+
+    def what_if(self, bridge_id, rng=None):
+        """
+        The averages of the run as if bridge_id had also been broken
+        """
+        return self.evaluate([bridge_id], rng).iloc[0]
+
+    def _candidates(self, route):
+        """
+        The positions of the bridges on a route that are not broken, and for each the change
+        of the driving ticks of the route if the truck would also stop there
+        """
+        sink = len(route) - 1
+        stops = [position for position in route.stops if position != sink]
+        broken = [position for position in stops if route.infra[position].broken]
+
+        candidates = []
+        ticks = []
+        previous = 0
+        following = iter(broken + [sink])
+        next_stop = next(following)
+        for position in stops:
+            if position == next_stop:
+                previous = position
+                next_stop = next(following)
+                continue
+            # the truck starts driving from the start of the previous broken bridge (or the origin)
+            offset = route.cum_start(previous) if previous > 0 else 0.0
+            before = DiscreteEventVehicles.drive_ticks(route, offset, next_stop)[0]
+            after = DiscreteEventVehicles.drive_ticks(route, offset, position)[0] + \
+                DiscreteEventVehicles.drive_ticks(route, route.cum_start(position), next_stop)[0]
+            candidates.append(position)
+            ticks.append(after - before)
+        return np.array(candidates, dtype=np.int64), np.array(ticks, dtype=np.int64)
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,306 @@
+import heapq
+import numpy as np
+from math import ceil
+from bisect import bisect_right
+from components import Sink, Bridge, Source, Vehicle
+
+
+# ---------------------------------------------------------------
+class Trip:
+    """
+    A truck in the discrete-event engine; it only exists between its events
+
+    Attributes
+    __________
+    route: Route
+        the compiled route of the truck
+
+    location_index: int
+        a pointer to the Infra in the route where the truck was at its last event
+
+    route_offset: float
+        the distance in meters driven from the start of the route at its last event
+
+    generated_at_step: int
+        the timestamp (number of ticks) that the truck is generated
+
+    waiting_time_agent: float
+        total waiting_time for the truck in the journey
+
+    number: int
+        the order in which the trucks are generated
+
+    departed_from: int
+        the location_index before the last scheduled arrival, the bridges after it are crossed on arrival
+
+    departs_at: int
+        the tick in which the truck starts driving from departed_from
+
+    departure_offset: float
+        the route_offset at departed_from
+
+    counted_to: int
+        the position up to which the crossed bridges are counted; departed_from, unless the statistics
+        were reset while the truck was on the road
+    """
+
+    __slots__ = ('route', 'location_index', 'route_offset', 'generated_at_step', 'waiting_time_agent', 'number',
+                 'departed_from', 'departs_at', 'departure_offset', 'counted_to')
+
+    def __init__(self, number, route, generated_at_step):
+        self.number = number
+        self.route = route
+        self.location_index = 0
+        self.departed_from = 0
+        self.departs_at = generated_at_step + 1
+        self.departure_offset = 0.0
+        self.counted_to = 0
+        self.route_offset = 0.0
+        self.generated_at_step = generated_at_step
+        self.waiting_time_agent = 0
+
+
+# ---------------------------------------------------------------
+class DiscreteEventVehicles:
+    """
+    Event-queue vehicle engine
+
+    Instead of moving every truck every tick, the engine keeps a priority queue
+    of events keyed by the tick in which they happen: a source generating a truck,
+    and a truck arriving at a broken bridge or at its sink. The tick of the next
+    arrival follows from the route length between two stops and Vehicle.speed.
+    The time a truck waits at a bridge is known when it arrives there.
+
+    Within a tick, events are handled in the order of the time-stepped model:
+    first the sources, then the trucks in the order they were generated. Random
+    numbers are therefore drawn in the same order and the same seed gives the
+    same travel and waiting times, while the run cost scales with
+    the number of trucks and bridge crossings instead of ticks x agents.
+    The crossings of the bridges that are not broken are counted when the truck
+    arrives at its next stop; the crossings of the trucks still on the road are
+    added when the counters are exported (see pending_crossings).
+
+    Attributes
+    __________
+    queue: list
+        heap of (tick, phase, order, item) events,
+        phase GENERATE with a Source or ARRIVE with a Trip;
+        order is the order of the sources or the number of the trip
+
+    count: int
+        the number of trucks in the network
+    """
+
+    GENERATE = 0
+    ARRIVE = 1
+
+    def __init__(self, model):
+        self.model = model
+        self.queue = []
+        self.count = 0
+
+        sources = [agent for agent in model.infra if isinstance(agent, Source)]
+        steps = model.schedule.steps
+        for order, source in enumerate(sources):
+            # the first tick at or after now in which the source generates a truck
+            tick = -(-steps // source.generation_frequency) * source.generation_frequency
+            heapq.heappush(self.queue, (tick, DiscreteEventVehicles.GENERATE, order, source))
+
+    def __len__(self):
+        return self.count
+
+    def step(self):
+        """
+        Handle the events of one tick
+        """
+        self.run_until(self.model.schedule.steps + 1)
+
+    def run_until(self, end):
+        """
+        Handle all events before tick end and set the schedule clock to end
+        """
+        queue = self.queue
+        schedule = self.model.schedule
+        while queue and queue[0][0] < end:
+            tick, phase, order, item = heapq.heappop(queue)
+            schedule.steps = tick
+            schedule.time = tick
+            if phase == DiscreteEventVehicles.GENERATE:
+                self.generate_truck(item)
+                heapq.heappush(queue, (tick + item.generation_frequency, phase, order, item))
+            else:
+                self.arrive(item, tick)
+        schedule.steps = end
+        schedule.time = end
+
+    def generate_truck(self, source):
+        """
+        Generates a truck at the given source and schedules its first arrival
+        """
+        route = self.model.get_route(source.unique_id)
+        if len(route) < 2:
+            # No route to the sink, no truck
+            return
+
+        tick = self.model.schedule.steps
+        trip = Trip(self.model.trucks_generated, route, tick)
+        self.model.trucks_generated += 1
+        Source.truck_counter += 1
+        self.count += 1
+        # A truck starts driving in the tick after it is generated
+        self.schedule_arrival(trip, tick + 1)
+
+    def schedule_arrival(self, trip, tick):
+        """
+        Schedule the arrival at the next stop of a trip that starts driving in the given tick
+        """
+        route = trip.route
+        stop = self.next_stop(route, trip.location_index)
+        ticks, offset = self.drive_ticks(route, trip.route_offset, stop)
+
+        trip.departed_from = trip.location_index
+        trip.counted_to = trip.location_index
+        trip.departs_at = tick
+        trip.departure_offset = trip.route_offset
+        trip.location_index = stop
+        trip.route_offset = offset
+        heapq.heappush(self.queue, (tick + ticks - 1, DiscreteEventVehicles.ARRIVE, trip.number, trip))
+
+    @staticmethod
+    def drive_ticks(route, offset, stop):
+        """
+        The number of ticks to drive from offset to the start of the stop, and the route_offset at arrival
+        """
+        start = route.cum_start(stop)
+        distance = Vehicle.speed * Vehicle.step_time
+        ticks = max(1, ceil((start - offset) / distance))
+        arrival_offset = offset + ticks * distance
+        # A truck that ends a tick exactly at the end of the Infra before the stop stays there
+        if arrival_offset == start and arrival_offset - distance >= route.cum_start(stop - 1):
+            ticks += 1
+            arrival_offset += distance
+        return ticks, arrival_offset
+
+    @staticmethod
+    def next_stop(route, location_index):
+        """
+        The position of the first broken bridge or sink after location_index
+        """
+        for stop in route.stops[bisect_right(route.stops, location_index):]:
+            infra = route.infra[stop]
+            if isinstance(infra, Sink) or infra.broken:
+                return stop
+        return len(route) - 1
+
+    def arrive(self, trip, tick):
+        """
+        A trip arrives at a broken bridge or at its sink
+        """
+        route = trip.route
+        next_infra = route.infra[trip.location_index]
+
+        # the bridges crossed since the last event, up to and including this one
+        bridge_delays = self.model.bridge_delays
+        first = bisect_right(route.stops, trip.counted_to)
+        last = bisect_right(route.stops, trip.location_index)
+        if isinstance(next_infra, Sink):
+            last -= 1
+        bridge_delays.cross(route.stop_indices[first:last])
+
+        if isinstance(next_infra, Sink):
+            self.model.record_trip(trip.number, route, tick - trip.generated_at_step, trip.waiting_time_agent)
+            self.count -= 1
+            return
+
+        waiting_time = Bridge.get_delay_time(next_infra)
+        trip.waiting_time_agent += waiting_time
+        self.model.record_wait(trip.number, route.stop_indices[last - 1], waiting_time)
+        if waiting_time > 0:
+            # wait at the start of the bridge; the truck drives again in the tick its waiting time runs out
+            trip.route_offset = route.cum_start(trip.location_index)
+            self.schedule_arrival(trip, tick + ceil(waiting_time))
+        else:
+            self.schedule_arrival(trip, tick + 1)
+
+    def refresh_stops(self):
+        """
+        Reschedule the arrivals of all trips, after bridges have been broken or repaired
+
+        A trip keeps driving from where it departed; its next stop becomes the first broken bridge
+        (or the sink) after the position it has reached by now, as in the time-stepped engines.
+        """
+        tick = self.model.schedule.steps
+        queue = []
+        for event in self.queue:
+            if event[1] == DiscreteEventVehicles.ARRIVE:
+                trip = event[3]
+                route = trip.route
+                stop = self.next_stop(route, self.location(trip, tick))
+                ticks, offset = self.drive_ticks(route, trip.departure_offset, stop)
+                trip.location_index = stop
+                trip.route_offset = offset
+                event = (max(trip.departs_at + ticks - 1, tick), DiscreteEventVehicles.ARRIVE, trip.number, trip)
+            queue.append(event)
+        heapq.heapify(queue)
+        self.queue = queue
+
+    def pending_crossings(self):
+        """
+        The crossings per Infra (in the order of model.infra) of the trucks on the road that are not counted yet:
+        the bridges they passed since their last event, up to where they are now
+        """
+        tick = self.model.schedule.steps
+        crossed = []
+        for trip in self.trips():
+            route = trip.route
+            first = bisect_right(route.stops, trip.counted_to)
+            last = bisect_right(route.stops, self.location(trip, tick))
+            if last > first and route.stops[last - 1] == len(route) - 1:
+                last -= 1
+            crossed.append(route.stop_indices[first:last])
+        crossed = np.concatenate(crossed) if crossed else np.zeros(0, dtype=np.int64)
+        return np.bincount(crossed, minlength=len(self.model.infra))
+
+    def discard_pending_crossings(self):
+        """
+        Mark the crossings of the trucks on the road so far as counted, without counting them
+        """
+        tick = self.model.schedule.steps
+        for trip in self.trips():
+            trip.counted_to = max(trip.counted_to, self.location(trip, tick))
+
+    def trips(self):
+        """
+        The trucks in the network
+        """
+        return [item for _, phase, _, item in self.queue if phase == DiscreteEventVehicles.ARRIVE]
+
+    def location(self, trip, tick):
+        """
+        The position in its route of a trip at the start of the given tick, as in the time-stepped engines
+        """
+        if tick <= trip.departs_at:
+            return trip.departed_from
+        route = trip.route
+        offset = trip.departure_offset + (tick - trip.departs_at) * Vehicle.speed * Vehicle.step_time
+        if offset > route.cum_end[trip.departed_from]:
+            return min(bisect_right(route.cum_end, offset, trip.departed_from + 1), trip.location_index)
+        return trip.departed_from
+
+    def vehicle_counts(self):
+        """
+        The number of vehicles currently on each Infra (in the order of model.infra)
+        """
+        tick = self.model.schedule.steps
+        locations = [trip.route.indices[self.location(trip, tick)] for trip in self.trips()]
+        return np.bincount(np.array(locations, dtype=np.int64), minlength=len(self.model.infra))
+
+    def waiting_count(self):
+        """
+        The number of vehicles currently waiting at a bridge
+        """
+        tick = self.model.schedule.steps
+        # a trip that departs from a bridge waits there until it departs
+        return sum(trip.departed_from > 0 and tick <= trip.departs_at for trip in self.trips())
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,352 @@
+from bisect import bisect_right
+from math import sqrt, nan
+from importlib.util import find_spec
+import numpy as np
+import pandas as pd
+
+
+# ---------------------------------------------------------------
+class P2Quantile:
+    """
+    Streaming estimate of one quantile with the P-square algorithm
+    (Jain & Chlamtac, 1985): five markers, constant memory
+
+    The estimate is best for observations in random order; when the observations
+    trend (e.g. the short trips finish first) it can be a few percent off.
+
+    Attributes
+    __________
+    p: float
+        the quantile to estimate, between 0 and 1
+
+    heights: list
+        the heights of the five markers; the middle one is the estimate
+
+    positions: list
+        the actual positions of the markers
+
+    desired: list
+        the desired positions of the markers
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.insert(bisect_right(heights, x), x)
+            return
+
+        # the cell of x, adjusting the extreme markers
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = bisect_right(heights, x) - 1
+
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        desired = self.desired
+        for i in range(5):
+            desired[i] += self.increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        heights = self.heights
+        if not heights:
+            return nan
+        if len(heights) < 5:
+            # exact for the first few observations
+            return heights[min(len(heights) - 1, int(round(self.p * (len(heights) - 1))))]
+        return heights[2]
+
+
+# ---------------------------------------------------------------
+class StreamingStatistics:
+    """
+    Constant-memory statistics of a stream of observations
+
+    Mean and variance follow Welford's algorithm; the mean is reported as
+    total / count so that it equals the average of the observations summed in order.
+
+    Attributes
+    __________
+    count: int
+        the number of observations
+
+    total: float
+        the sum of the observations
+
+    minimum, maximum: float
+        the smallest and largest observation
+
+    quantiles: dict
+        Key: quantile (e.g. 0.9)
+        Value: P2Quantile estimator
+    """
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.95)):
+        self.count = 0
+        self.total = 0
+        self.minimum = nan
+        self.maximum = nan
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+        if self.count == 1:
+            self.minimum = self.maximum = x
+        elif x < self.minimum:
+            self.minimum = x
+        elif x > self.maximum:
+            self.maximum = x
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    def add_many(self, values):
+        for x in values:
+            self.add(x)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else nan
+
+    @property
+    def variance(self):
+        """
+        The sample variance
+        """
+        return self._m2 / (self.count - 1) if self.count > 1 else nan
+
+    @property
+    def std(self):
+        return sqrt(self.variance) if self.count > 1 else nan
+
+    def quantile(self, p):
+        return self.quantiles[p].value()
+
+    def summary(self, label):
+        """
+        The statistics as a dict, with label in the keys
+        """
+        summary = {
+            'Average ' + label: self.mean,
+            label + ' Std': self.std,
+            label + ' Min': self.minimum,
+            label + ' Max': self.maximum,
+        }
+        for p in self.quantiles:
+            summary[label + ' P' + format(100 * p, 'g')] = self.quantile(p)
+        return summary
+
+
+# ---------------------------------------------------------------
+class DelayCounters:
+    """
+    Delay counters per Infra component, indexed by its position in model.infra
+
+    Recording a crossing or a delay only costs a few array increments.
+
+    Attributes
+    __________
+    crossings: ndarray (int)
+        the number of vehicles that reached each bridge
+
+    total_delay: ndarray (float)
+        the summed delay at each bridge
+
+    max_delay: ndarray (float)
+        the longest delay at each bridge
+
+    delayed: ndarray (int)
+        the number of vehicles that were delayed at each bridge
+    """
+
+    def __init__(self, size):
+        self.crossings = np.zeros(size, dtype=np.int64)
+        self.total_delay = np.zeros(size)
+        self.max_delay = np.zeros(size)
+        self.delayed = np.zeros(size, dtype=np.int64)
+
+    def cross(self, index):
+        """
+        Count a crossing of one bridge, or of each of an array of (distinct) bridges
+        """
+        self.crossings[index] += 1
+
+    def cross_many(self, indices):
+        """
+        Count one crossing per entry of an array of bridges, that may contain the same bridge more than once
+        """
+        np.add.at(self.crossings, indices, 1)
+
+    def delay(self, index, delay_time):
+        """
+        Record the delay of a vehicle at a bridge
+        """
+        if delay_time > 0:
+            self.total_delay[index] += delay_time
+            self.delayed[index] += 1
+            if delay_time > self.max_delay[index]:
+                self.max_delay[index] = delay_time
+
+    def to_frame(self, indices, pending_crossings=None):
+        """
+        The counters of the Infra at the given indices as a DataFrame, in the same order
+
+        pending_crossings: crossings per Infra that are not counted yet, added to the exported crossings only
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        crossings = self.crossings[indices]
+        if pending_crossings is not None:
+            crossings = crossings + pending_crossings[indices]
+        total_delay = self.total_delay[indices]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average_delay = np.where(crossings > 0, total_delay / crossings, 0.0)
+        return pd.DataFrame({'crossings': crossings, 'vehicles_delayed': self.delayed[indices],
+                             'total_delay': total_delay, 'max_delay': self.max_delay[indices],
+                             'average_delay': average_delay})
+
+
+# ---------------------------------------------------------------
+class TimeSeriesSampler:
+    """
+    Samples the state of a model every interval ticks into preallocated arrays
+
+    The arrays are sized from the run length when the sampler is created, so a
+    sample is a few array writes instead of a dict per step as in Mesa's DataCollector.
+
+    Attributes
+    __________
+    interval: int
+        the number of ticks between two samples
+
+    roads: list
+        the names of the roads, the columns of road_vehicles
+
+    size: int
+        the number of samples taken, i.e. the used part of the arrays
+
+    tick: ndarray (int)
+        the tick of each sample
+
+    vehicles: ndarray (int)
+        the number of vehicles in the system
+
+    waiting: ndarray (int)
+        the number of vehicles waiting at a bridge
+
+    arrivals: ndarray (int)
+        the number of vehicles that reached their sink since the previous sample
+
+    road_vehicles: ndarray (int)
+        the number of vehicles on each road, one row per sample
+    """
+
+    def __init__(self, model, interval, run_length):
+        self.model = model
+        self.interval = interval
+        self.roads = list(model.road_list)
+
+        # the road of each Infra, by position in model.infra
+        road_rank = {road: rank for rank, road in enumerate(self.roads)}
+        self._infra_road = np.array([road_rank[agent.road_name] for agent in model.infra], dtype=np.int64)
+        self._arrived = model.trucks_sink_counter
+
+        capacity = run_length // interval + 1
+        self.size = 0
+        self.tick = np.zeros(capacity, dtype=np.int64)
+        self.vehicles = np.zeros(capacity, dtype=np.int64)
+        self.waiting = np.zeros(capacity, dtype=np.int64)
+        self.arrivals = np.zeros(capacity, dtype=np.int64)
+        self.road_vehicles = np.zeros((capacity, len(self.roads)), dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def restart(self):
+        """
+        Discard the samples so far, the next sample starts a new series
+        """
+        self.size = 0
+        self._arrived = self.model.trucks_sink_counter
+
+    def sample(self):
+        """
+        Take a sample of the current state of the model
+        """
+        if self.size == len(self.tick):
+            # more samples than the run length was sized for
+            for name in ('tick', 'vehicles', 'waiting', 'arrivals', 'road_vehicles'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+
+        model = self.model
+        counts = model.vehicle_counts()
+        i = self.size
+        self.tick[i] = model.schedule.steps
+        self.vehicles[i] = counts.sum()
+        self.waiting[i] = model.waiting_count()
+        self.arrivals[i] = model.trucks_sink_counter - self._arrived
+        self._arrived = model.trucks_sink_counter
+        self.road_vehicles[i] = np.bincount(self._infra_road, weights=counts, minlength=len(self.roads))
+        self.size += 1
+
+    def to_frame(self):
+        """
+        The samples as a DataFrame, with one column per road
+        """
+        size = self.size
+        df = pd.DataFrame({'tick': self.tick[:size], 'vehicles': self.vehicles[:size],
+                           'waiting': self.waiting[:size], 'arrivals': self.arrivals[:size]})
+        roads = pd.DataFrame(self.road_vehicles[:size], columns=['vehicles_' + road for road in self.roads])
+        return pd.concat([df, roads], axis=1)
+
+    def save(self, file_name):
+        """
+        Write the samples to file_name.parquet if pyarrow is installed, otherwise to file_name.npz;
+        returns the name of the written file
+        """
+        if find_spec('pyarrow') is not None:
+            file_name += '.parquet'
+            self.to_frame().to_parquet(file_name, index=False)
+        else:
+            file_name += '.npz'
+            size = self.size
+            np.savez_compressed(file_name, tick=self.tick[:size], vehicles=self.vehicles[:size],
+                                waiting=self.waiting[:size], arrivals=self.arrivals[:size],
+                                road_vehicles=self.road_vehicles[:size], roads=np.array(self.roads))
+        return file_name
+
+# EOF -----------------------------------------------------------
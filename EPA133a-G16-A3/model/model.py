@@ -1,13 +1,21 @@
-import traceback
-
 from mesa import Model
-from mesa.time import BaseScheduler
 from mesa.space import ContinuousSpace
-from components import Source, Sink, SourceSink, Bridge, Link, Intersection
+from components import Source, Sink, SourceSink, Bridge, Link, Intersection, Vehicle
+from vectorized import VectorizedVehicles
+from events import DiscreteEventVehicles
+from routes import Route
+from network import load_network
+from scheduler import ActiveScheduler
+from kpi import StreamingStatistics, DelayCounters, TimeSeriesSampler
+from trip_log import TripLog
+from scenarios import BridgeFailureSampler
+from atomic_file import atomic_write
+import numpy as np
 import pandas as pd
+import random
 from collections import defaultdict
-import networkx as nx
-import matplotlib.pyplot as plt
+from functools import partial
+import pickle
 
 
 
@@ -45,10 +53,14 @@ class BangladeshModel(Model):
 
     path_ids_dict: defaultdict
         Key: (origin, destination)
-        Value: the shortest path (Infra component IDs) from an origin to a destination
+        Value: the shortest path from an origin to a destination, compiled into a Route
+
+    routing_graph: Graph
+        the graph with the chains of links contracted into weighted edges, see contract_graph
 
-        Only straight paths in the Demo are added into the dict;
-        when there is a more complex network layout, the paths need to be managed differently
+    route_table: RouteTable
+        the shortest paths (Infra component IDs) between all sources and sinks,
+        loaded from (or saved to) the cache folder
 
     sources: list
         all sources in the network
@@ -59,14 +71,66 @@ class BangladeshModel(Model):
     bridges: list
         all bridges in the network
 
-    total_travel_time: list
-        the travel time of each agent that has reached the end of the road
+    infra: list
+        all Infra components in the network, in the order they are generated
+
+    infra_index: dict
+        Key: unique_id of an Infra component
+        Value: its index in infra
+
+    network: Network
+        the parsed csv file, graph and route table, shared by all model instances of the same file
+
+    travel_time_statistics: StreamingStatistics
+        count, mean, variance, min, max and quantiles of the travel time
+        of the agents that have reached the end of the road
 
     truck_sink_counter: int
         the number of trucks that reach the end of the road
 
-    total_waiting_time:
-        the total waiting time of each agent that has reached the end of the road
+    trucks_generated: int
+        the number of trucks generated in this run, used to number them
+
+    waiting_time_statistics: StreamingStatistics
+        the same statistics of the total waiting time of those agents
+
+    bridge_delays: DelayCounters
+        crossings, total delay, max delay and vehicles delayed per bridge, indexed like infra
+
+    engine: str
+        'agent': every truck is a Vehicle agent in the schedule (default)
+        'vector': all trucks are stored in the arrays of a VectorizedVehicles engine
+        'event': trucks only exist as events in the queue of a DiscreteEventVehicles engine
+
+    vehicles: VectorizedVehicles | DiscreteEventVehicles
+        the vehicle engine when engine is 'vector' or 'event', otherwise None
+
+    time_series: TimeSeriesSampler
+        samples the vehicles in the system every interval ticks, see sample_every; None if not sampling
+
+    trip_log: TripLog
+        one record per trip and per delay at a bridge, see log_trips; None if not logging
+
+    common_random_numbers: bool
+        False: all random numbers are drawn from model.random, in the order they are needed (default)
+        True: the random numbers are drawn from independent streams per purpose, derived from the seed:
+        demand_random for the sinks of the trucks, failure_random for the broken bridges and one
+        stream per bridge for its delays. The same seed then gives the same demand in every scenario.
+
+    demand_random, failure_random: Random
+        the random number generators of the demand and of the broken bridges;
+        both are model.random unless common_random_numbers is True
+
+    failure_sampler: BridgeFailureSampler
+        with common_random_numbers, the failure ranks of the bridges that decide which bridges break,
+        drawn from failure_random; otherwise None
+
+    measured_from: int
+        the tick from which the statistics are collected: 0, or the tick at which the model was forked
+
+    checkpoint_interval: int
+        the model is saved to checkpoint_file every checkpoint_interval ticks, see checkpoint_every;
+        None if not checkpointing
     """
 
 
@@ -74,73 +138,86 @@ class BangladeshModel(Model):
 
     file_name = '../data/N1_N2_v4.csv'
 
-    def __init__(self, seed=None,   x_max=500, y_max=500, x_min=0, y_min=0, scen_dict = {'A': 0, 'B': 0, 'C': 0, 'D': 0}):
+    # a list of names of roads to be generated
+    # The network can discover all roads of the csv from its road column (roads=None), but this subset
+    # is kept on purpose, so the results stay comparable with the earlier results in the output folder
+    roads = ['R170', 'Z1044', 'N204', 'R240', 'R211', 'Z1034', 'N1', 'R301', 'Z1031', 'Z1048', 'N105', 'N102', 'N208', 'N104', 'N207', 'R360', 'R151', 'N2', 'Z1042', 'R141']
+
+    def __init__(self, seed=None,   x_max=500, y_max=500, x_min=0, y_min=0, scen_dict = {'A': 0, 'B': 0, 'C': 0, 'D': 0}, engine='agent',
+                 network=None, common_random_numbers=False):
 
-        self.schedule = BaseScheduler(self)
+        self.schedule = ActiveScheduler(self)
         self.running = True
-        self.path_ids_dict = defaultdict(lambda: pd.Series())
+        self.path_ids_dict = defaultdict(partial(Route, self, []))
         self.space = None
         self.sources = []
         self.sinks = []
         self.bridges = []
+        self.infra = []
+        self.infra_index = {}
 
-        # DF of roads
-        self.road_df = None
-        self.road_list = []
+        # The network is parsed once per csv file and shared by all model instances
+        if network is None:
+            network = load_network(self.file_name, self.roads)
+        self.network = network
+        self.road_list = list(network.roads)
 
-        self.total_travel_time = []
+        # Constant-memory statistics, updated by record_trip
+        self.travel_time_statistics = StreamingStatistics()
         self.trucks_sink_counter = 0
-        self.total_waiting_time = []
+        self.trucks_generated = 0
+        self.waiting_time_statistics = StreamingStatistics()
 
         self.amount_of_bridges = 0
 
+        self.common_random_numbers = common_random_numbers
+        if common_random_numbers:
+            self.demand_random = random.Random(self.stream_seed('demand'))
+            self.failure_random = random.Random(self.stream_seed('failure'))
+        else:
+            self.demand_random = self.random
+            self.failure_random = self.random
+
         self.generate_model()
+        self.bridge_delays = DelayCounters(len(self.infra))
 
-        # Generate a graph and set the graph as attribute to the model.
-        # Therefore, it is possible to use the graph during other functions
-        self.graph = self.generate_graph()
+        # Routes are searched on a graph in which the chains of links are contracted
+        self.routing_graph = network.routing_graph
+        # The shortest paths between all sources and sinks, shared by all runs on this network
+        self.route_table = network.route_table
         # The method break_bridges is called to determine which
         # bridges should break with the scenario dictionary as input
         self.break_bridges(scen_dict)
         #print(self.path_ids_dict)
 
+        # In the vector and event engines the trucks are not agents, the sources are stepped by the engine
+        self.engine = engine
+        self.vehicles = None
+        if engine == 'vector':
+            self.vehicles = VectorizedVehicles(self)
+        elif engine == 'event':
+            self.vehicles = DiscreteEventVehicles(self)
+        elif engine != 'agent':
+            raise ValueError("Unknown engine: " + str(engine))
+
+        self.time_series = None
+        self.trip_log = None
+        self.measured_from = 0
+        self.checkpoint_interval = None
+        self.checkpoint_file = None
+
     def generate_model(self):
         """
-        generate the simulation model according to the csv file component information
+        generate the simulation model according to the components of the network
 
-        Warning: the labels are the same as the csv column labels
+        Only the agents are created here; everything that is read from the csv file is in the shared Network
         """
-
-        df = pd.read_csv(self.file_name)
-        self.road_df = df
-
-
-        # a list of names of roads to be generated
-        # TODO You can also read in the road column to generate this list automatically
-        # Create a list of the roads we have used
-        roads = ['R170', 'Z1044', 'N204', 'R240', 'R211', 'Z1034', 'N1', 'R301', 'Z1031', 'Z1048', 'N105', 'N102', 'N208', 'N104', 'N207', 'R360', 'R151', 'N2', 'Z1042', 'R141']
-        self.road_list = roads
-
-        #build and save networkx grah
-        df_objects_all = []
-        for road in roads:
-            # Select all the objects on a particular road in the original order as in the cvs
-            df_objects_on_road = df[df['road'] == road]
-            # acces paths from networkx
-
-            if not df_objects_on_road.empty:
-                df_objects_all.append(df_objects_on_road)
-
-                # It has been decided to not set the path_dictionary the original way anymore,
-                # Networkx shortest path is used. This is done in the get_random_route function
-
-        # put back to df with selected roads so that min and max and be easily calculated
-        df = pd.concat(df_objects_all)
+        network = self.network
         y_min, y_max, x_min, x_max = set_lat_lon_bound(
-            df['lat'].min(),
-            df['lat'].max(),
-            df['lon'].min(),
-            df['lon'].max(),
+            network.lat_min,
+            network.lat_max,
+            network.lon_min,
+            network.lon_max,
             0.05
         )
 
@@ -148,72 +225,64 @@ class BangladeshModel(Model):
         # not to be confused with the SimpleContinuousModule visualization
         self.space = ContinuousSpace(x_max, y_max, True, x_min, y_min)
 
-        for df in df_objects_all:
-            for _, row in df.iterrows():  # index, row in ...
-
-                # create agents according to model_type
-                model_type = row['model_type'].strip()
-                agent = None
-
-                name = row['name']
-                if pd.isna(name):
-                    name = ""
-                else:
-                    name = name.strip()
-
-                if model_type == 'source':
-                    agent = Source(row['id'], self, row['length'], name, row['road'])
-                    self.sources.append(agent.unique_id)
-                elif model_type == 'sink':
-                    agent = Sink(row['id'], self, row['length'], name, row['road'])
-                    self.sinks.append(agent.unique_id)
-                elif model_type == 'sourcesink':
-                    agent = SourceSink(row['id'], self, row['length'], name, row['road'])
-                    self.sources.append(agent.unique_id)
-                    self.sinks.append(agent.unique_id)
-                elif model_type == 'bridge':
-                    # To check whether a bridge should break, its condition is needed
-                    agent = Bridge(row['id'], self, row['length'], name, row['road'], row['condition'])
-                    self.bridges.append(agent)
-                elif model_type == 'link':
-                    agent = Link(row['id'], self, row['length'], name, row['road'])
-                elif model_type == 'intersection':
-                    if not row['id'] in self.schedule._agents:
-                        agent = Intersection(row['id'], self, row['length'], name, row['road'])
-                if agent:
-                    self.schedule.add(agent)
-                    y = row['lat']
-                    x = row['lon']
-                    self.space.place_agent(agent, (x, y))
-                    agent.pos = (x, y)
+        for model_type, infra_id, length, name, road, condition, x, y in network.components:
+            # create agents according to model_type
+            agent = None
+            if model_type == 'source':
+                agent = Source(infra_id, self, length, name, road)
+                self.sources.append(agent.unique_id)
+            elif model_type == 'sink':
+                agent = Sink(infra_id, self, length, name, road)
+                self.sinks.append(agent.unique_id)
+            elif model_type == 'sourcesink':
+                agent = SourceSink(infra_id, self, length, name, road)
+                self.sources.append(agent.unique_id)
+                self.sinks.append(agent.unique_id)
+            elif model_type == 'bridge':
+                # To check whether a bridge should break, its condition is needed
+                agent = Bridge(infra_id, self, length, name, road, condition)
+                self.bridges.append(agent)
+            elif model_type == 'link':
+                agent = Link(infra_id, self, length, name, road)
+            elif model_type == 'intersection':
+                agent = Intersection(infra_id, self, length, name, road)
+            if agent:
+                self.infra_index[agent.unique_id] = len(self.infra)
+                self.infra.append(agent)
+                self.schedule.add(agent)
+                self.space.place_agent(agent, (x, y))
+                agent.pos = (x, y)
+
+    @property
+    def graph(self):
+        """
+        The graph of the network; it is possible to use the graph during other functions
+        """
+        return self.network.graph
 
     def get_random_route(self, source):
         """
         pick up a random route given an origin
+
+        Only sinks that can be reached from the origin are drawn;
+        an empty Route is returned when there are none
         """
+        reachable_sinks = self.route_table.reachable_sinks(source)
+        if not reachable_sinks:
+            return Route(self, [])
+
         while True:
-            # different source and sink
-            sink = self.random.choice(self.sinks)
-            if sink is not source:
+            # different source and sink, with a path in between
+            sink = self.demand_random.choice(self.sinks)
+            if sink is not source and sink in reachable_sinks:
                 break
         # Check if there is a path already in the dictionary
         if (source, sink) not in self.path_ids_dict.keys():
             #print("We go from ", source, "to ", sink)
-            # Try to create the shortest path from source to sink, using networkx
-            try:
-                shortest_path = nx.shortest_path(self.graph, source=source, target=sink)
-                route = pd.Series(shortest_path)
-                # Add the new route to the path dictionary
-                self.path_ids_dict[(source, sink)] = route
-                #print("the path is", self.path_ids_dict[source, sink])
-            except nx.NetworkXNoPath:
-                # If it was not possible to create the path, give an error
-                traceback.print_exc()
-                print("No path found")
-        # If the path is already in the dictionary, return the correct path
-        else:
-            #print("path already generated")
-            return self.path_ids_dict[source, sink]
+            # Look up the shortest path from source to sink in the precomputed route table
+            # Compile the route once and add it to the path dictionary
+            self.path_ids_dict[(source, sink)] = Route(self, self.route_table.get(source, sink))
+            #print("the path is", self.path_ids_dict[source, sink].path_ids)
 
         return self.path_ids_dict[source, sink]
 
@@ -233,28 +302,226 @@ class BangladeshModel(Model):
         """
         Advance the simulation by one step.
         """
-        self.schedule.step()
+        if self.vehicles is not None:
+            self.vehicles.step()
+        else:
+            self.schedule.step()
+        self.sample()
+        self.checkpoint()
+
+    def run(self, run_length):
+        """
+        Advance the simulation by run_length steps
+        """
+        if self.vehicles is not None:
+            end = self.schedule.steps + run_length
+            # run from sample or checkpoint to the next one
+            intervals = []
+            if self.time_series is not None:
+                intervals.append(self.time_series.interval)
+            if self.checkpoint_interval is not None:
+                intervals.append(self.checkpoint_interval)
+            while self.schedule.steps < end:
+                self.vehicles.run_until(min([end] + [(self.schedule.steps // interval + 1) * interval
+                                                     for interval in intervals]))
+                self.sample()
+                self.checkpoint()
+        else:
+            for _ in range(run_length):
+                self.step()
+
+    def sample_every(self, interval, run_length):
+        """
+        Sample the vehicles in the system every interval ticks, for a run of run_length ticks
+        """
+        self.time_series = TimeSeriesSampler(self, interval, run_length)
+        return self.time_series
+
+    def sample(self):
+        """
+        Take a time series sample if one is due in this tick
+        """
+        if self.time_series is not None and self.schedule.steps % self.time_series.interval == 0:
+            self.time_series.sample()
+
+    def checkpoint_every(self, interval, file_name):
+        """
+        Save the model to file_name every interval ticks, overwriting the previous checkpoint
+        """
+        self.checkpoint_interval = interval
+        self.checkpoint_file = file_name
+
+    def checkpoint(self):
+        """
+        Save a checkpoint if one is due in this tick
+        """
+        if self.checkpoint_interval is not None and self.schedule.steps % self.checkpoint_interval == 0:
+            self.save(self.checkpoint_file)
+
+    def save(self, file_name):
+        """
+        Save the complete state of the model: the vehicles, the random number generators,
+        the broken bridges and the statistics, without the shared network
+
+        The file is written to a temporary file first, so an interrupted save leaves the previous one intact
+        """
+        atomic_write(file_name, partial(pickle.dump, self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def load(file_name):
+        """
+        Load a model saved with save; it continues from the tick at which it was saved
+        """
+        with open(file_name, 'rb') as file:
+            return pickle.load(file)
+
+    def __getstate__(self):
+        # The network is shared and immutable: only the file it was read from is saved
+        state = self.__dict__.copy()
+        network = state.pop('network')
+        del state['routing_graph'], state['route_table']
+        state['network_file'] = network.file_name, network.roads
+        # The truck names are numbered by a class attribute, shared by all models in the process
+        state['truck_counter'] = Source.truck_counter
+        return state
+
+    def __setstate__(self, state):
+        file_name, roads = state.pop('network_file')
+        # Never lower the counter, the trucks of other models in this process keep their unique names
+        Source.truck_counter = max(Source.truck_counter, state.pop('truck_counter'))
+        self.__dict__.update(state)
+        self.network = load_network(file_name, roads)
+        self.routing_graph = self.network.routing_graph
+        self.route_table = self.network.route_table
+
+    def vehicle_counts(self):
+        """
+        The number of vehicles currently on each Infra (in the order of infra)
+        """
+        if self.vehicles is not None:
+            return self.vehicles.vehicle_counts()
+        infra_index = self.infra_index
+        locations = [infra_index[vehicle.location.unique_id] for vehicle in self.schedule.get_vehicles()]
+        return np.bincount(np.array(locations, dtype=np.int64), minlength=len(self.infra))
+
+    def waiting_count(self):
+        """
+        The number of vehicles currently waiting at a bridge
+        """
+        if self.vehicles is not None:
+            return self.vehicles.waiting_count()
+        return sum(vehicle.state == Vehicle.State.WAIT for vehicle in self.schedule.get_vehicles())
 
     def break_bridges(self, scenario_dict):
         """
         Determines which bridge should break and flags them
+
+        With common_random_numbers, the bridges are broken by their failure ranks (see BridgeFailureSampler),
+        so the broken bridges of a seed are nested across scenarios with increasing percentages
         """
+        self.failure_sampler = None
+        if self.common_random_numbers:
+            rng = np.random.default_rng(self.failure_random.getrandbits(128))
+            self.failure_sampler = BridgeFailureSampler([bridge.condition for bridge in self.bridges], rng)
+            for bridge, broken in zip(self.bridges, self.failure_sampler.broken(scenario_dict).tolist()):
+                if broken:
+                    bridge.broken = True
+            return
+
+        # Groups the bridges by condition (A,B,C,D) in one pass
+        bridges_per_condition = defaultdict(list)
+        for bridge in self.bridges:
+            bridges_per_condition[bridge.condition].append(bridge)
+
         # Checks what bridges have a certain key (A,B,C,D) and adds them to a list
         for key in scenario_dict:
-            bridges_condition_list = []
-            for bridge in self.bridges:
-                if bridge.condition == key:
-                    bridges_condition_list.append(bridge)
+            bridges_condition_list = list(bridges_per_condition[key])
 
             # Determines what amount of bridges of a certain condition should be broken with the scenario dictionary,
             # then makes random choices and flags them
             amount_bridges = len(bridges_condition_list)
             amount_bridges_to_break = int((scenario_dict[key] / 100) * amount_bridges)
             for i in range(amount_bridges_to_break):
-                bridge_to_break = self.random.choice(bridges_condition_list)
+                bridge_to_break = self.failure_random.choice(bridges_condition_list)
                 bridge_to_break.broken = True
                 bridges_condition_list.remove(bridge_to_break)
 
+    def fork(self, scenario_dict):
+        """
+        A copy of the model in its current state, in which the bridges of scenario_dict are broken instead
+
+        The trucks on the road keep their position and stop at the new broken bridges ahead of them;
+        trucks that are waiting at a bridge finish their delay. The statistics of the copy start at this tick,
+        so the model can be warmed up once and forked into every scenario. With common_random_numbers,
+        the copies draw the same demand and the same delays per bridge from here on.
+        """
+        clone = pickle.loads(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+        for bridge in clone.bridges:
+            bridge.broken = False
+        clone.break_bridges(scenario_dict)
+        if clone.vehicles is not None:
+            clone.vehicles.refresh_stops()
+        clone.reset_statistics()
+        return clone
+
+    def reset_statistics(self):
+        """
+        Discard the statistics, trip log and time series so far, and collect them from this tick on
+        """
+        self.measured_from = self.schedule.steps
+        self.travel_time_statistics = StreamingStatistics()
+        self.waiting_time_statistics = StreamingStatistics()
+        self.trucks_sink_counter = 0
+        self.bridge_delays = DelayCounters(len(self.infra))
+        if self.engine == 'event':
+            # the crossings of the trucks on the road so far belong to the discarded statistics
+            self.vehicles.discard_pending_crossings()
+        if self.trip_log is not None:
+            self.log_trips()
+        if self.time_series is not None:
+            self.time_series.restart()
+
+    def log_trips(self):
+        """
+        Log every trip and every delay at a bridge from now on
+        """
+        self.trip_log = TripLog()
+        return self.trip_log
+
+    def record_trip(self, number, route, travel_time, waiting_time):
+        """
+        Record truck number that has reached the end of its route in this tick
+        """
+        self.travel_time_statistics.add(travel_time)
+        self.waiting_time_statistics.add(waiting_time)
+        self.trucks_sink_counter += 1
+        if self.trip_log is not None:
+            steps = self.schedule.steps
+            self.trip_log.append(number, route.infra[0].unique_id, route.infra[-1].unique_id,
+                                 steps - travel_time, steps, waiting_time)
+
+    def record_wait(self, number, index, delay_time):
+        """
+        Record the delay of truck number at the bridge at index in infra in this tick
+        """
+        self.bridge_delays.delay(index, delay_time)
+        if self.trip_log is not None and delay_time > 0:
+            self.trip_log.wait(number, self.infra[index].unique_id, self.schedule.steps, delay_time)
+
+    def stream_seed(self, *purpose):
+        """
+        The seed of the random number stream of a purpose, derived from the seed of the model
+        """
+        return '/'.join(str(part) for part in (self._seed,) + purpose)
+
+    def delay_stream(self, bridge):
+        """
+        The random number generator of the delays at a bridge
+        """
+        if self.common_random_numbers:
+            return random.Random(self.stream_seed('delay', bridge.unique_id))
+        return self.random
+
     def get_data(self):
         """
         Own data collector, more efficient as it generates data at end of model
@@ -262,50 +529,37 @@ class BangladeshModel(Model):
         data_dict = {}
         # Seed is being used as column name
         seed = str(self._seed)
-        # Average travel time and average waiting time are being reported per run in one df per scenario
-        data_dict['Average Travel Time'] = sum(self.total_travel_time) / self.trucks_sink_counter
-        data_dict['Average Waiting Time'] = sum(self.total_waiting_time) / self.trucks_sink_counter
+        # Average travel time and average waiting time are being reported per run in one df per scenario,
+        # followed by the spread and the percentiles
+        data_dict['Average Travel Time'] = self.travel_time_statistics.mean
+        data_dict['Average Waiting Time'] = self.waiting_time_statistics.mean
+        data_dict.update(self.travel_time_statistics.summary('Travel Time'))
+        data_dict.update(self.waiting_time_statistics.summary('Waiting Time'))
+        data_dict['Trucks'] = self.trucks_sink_counter
         df = pd.DataFrame.from_dict(data_dict, orient='index', columns=[seed])
-        print('traveltime', self.total_travel_time)
-        print('waitingtime', self.total_waiting_time)
-        print('trucks', self.trucks_sink_counter)
         return df
 
-    def generate_graph(self):
-        G = nx.Graph()
-        df = self.road_df
-        road_list = self.road_list
-        # Create the graph per road
-        for road in road_list:
-            road_df = df.loc[df['road'] == road]
-            #print(road_df)
-            len_list = []
-            node_list_per_road = []
-            # Per ID, a node is added based on longitude and latitude.
-            for _, row in road_df.iterrows():
-                #print(row['id'])
-                G.add_node(int(row['id']), pos=(row['lon'], row['lat']))
-                # The length of the node to the next node is saved, to use for the edges
-                len_list.append(row['length'])
-                node_list_per_road.append(int(row['id']))
-            #print('len_list', len_list)
-            #print('node list', list(G.nodes))
-            # For each node we created (except the last one), we create an edge to the next node
-            # The weight of the edge is the length
-            for index, node in enumerate(node_list_per_road):
-                #print('\n')
-                #print('index',index)
-                #print('node',node)
-                #print('length node list',len(node_list_per_road))
-                if index < (len(node_list_per_road)-1):
-                    #print('next node', node_list_per_road[index + 1])
-                    #print('len_list index value', len_list[index])
-                    G.add_weighted_edges_from([(node, node_list_per_road[index + 1],len_list[index])])
-        pos = nx.get_node_attributes(G, 'pos')
-        nx.draw(G, pos, with_labels=False, node_color='pink', node_size=5)
-        plt.show()
-        print("de graaf is", G)
-        return G
+    def get_bridge_data(self):
+        """
+        The delay counters of each bridge, with its id, road and condition as in the csv file
+        """
+        bridges = self.network.bridges[['id', 'road', 'condition']].reset_index(drop=True)
+        indices = [self.infra_index[bridge_id] for bridge_id in bridges['id']]
+        broken = pd.Series([self.infra[index].broken for index in indices], name='broken')
+        # the event engine counts crossings on arrival; those of the trucks on the road are added here
+        pending = self.vehicles.pending_crossings() if self.engine == 'event' else None
+        return pd.concat([bridges, broken, self.bridge_delays.to_frame(indices, pending)], axis=1)
+
+    def get_road_data(self):
+        """
+        The delay counters of the bridges summed per road
+        """
+        bridge_data = self.get_bridge_data()
+        road_data = bridge_data.groupby('road', sort=False).agg(
+            bridges=('id', 'size'), broken=('broken', 'sum'), crossings=('crossings', 'sum'),
+            vehicles_delayed=('vehicles_delayed', 'sum'), total_delay=('total_delay', 'sum'),
+            max_delay=('max_delay', 'max'))
+        return road_data.reset_index()
 
 
 
@@ -0,0 +1,88 @@
+import os
+from model import BangladeshModel
+from run_control import RunController
+
+"""
+    One model run of a batch, see model_run.run_model_batch
+
+    The code of this module determines the results of a run, so it is part of the code version of the
+    ResultCache; the settings of a batch are in model_run.py, which can be edited without invalidating it
+"""
+
+# The last warm state loaded in this process
+_warm_state = (None, None)
+
+
+def run_job(index, scen_dict, seed, run_length, engine, sample_interval=None, trip_logs=False,
+            target_precision=None, common_random_numbers=False, checkpoint_interval=None, checkpoint_file=None,
+            warm_up=None, warm_up_scenario=None, warm_state_file=None, output_directory=None):
+    """
+    Runs the model once for one scenario and one seed, returns the data of the run
+    and the delay counters per bridge; the trip log and time series are saved in output_directory
+
+    With a checkpoint_interval, the model is saved to checkpoint_file every checkpoint_interval ticks,
+    and the run continues from checkpoint_file if it exists
+
+    With a warm_up, the model is forked from the state after warm_up ticks under warm_up_scenario,
+    which is loaded from warm_state_file (or simulated and saved there first), and run_length ticks are measured
+    """
+    if checkpoint_interval is not None and os.path.exists(checkpoint_file):
+        model = BangladeshModel.load(checkpoint_file)
+    elif warm_up is not None:
+        model = warm_state(seed, warm_up_scenario, warm_up, engine, sample_interval, trip_logs,
+                           common_random_numbers, warm_state_file).fork(scen_dict)
+    else:
+        model = BangladeshModel(seed=seed, scen_dict=scen_dict, engine=engine,
+                                common_random_numbers=common_random_numbers)
+        if sample_interval is not None:
+            model.sample_every(sample_interval, run_length)
+        if trip_logs:
+            model.log_trips()
+    if checkpoint_interval is not None:
+        model.checkpoint_every(checkpoint_interval, checkpoint_file)
+    end = run_length + (warm_up or 0)
+    if target_precision is None:
+        model.run(end - model.schedule.steps)
+        run_data = model.get_data()
+    else:
+        controller = RunController(model, target_precision, max_run_length=end).run()
+        run_data = controller.get_data()
+    if trip_logs:
+        model.trip_log.save(os.path.join(output_directory, 'trips_{}_{}.npz'.format(index, seed)))
+    if sample_interval is not None:
+        model.time_series.save(os.path.join(output_directory, 'time_series_{}_{}'.format(index, seed)))
+    if checkpoint_interval is not None and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    return index, seed, run_data, model.get_bridge_data()
+
+
+def warm_up_job(seed, scen_dict, warm_up, engine, sample_interval, trip_logs, common_random_numbers, file_name):
+    """
+    Simulate the warm state of a seed and save it to file_name, for the forks of run_job in other workers
+    """
+    warm_state(seed, scen_dict, warm_up, engine, sample_interval, trip_logs, common_random_numbers, file_name)
+
+
+def warm_state(seed, scen_dict, warm_up, engine, sample_interval, trip_logs, common_random_numbers, file_name):
+    """
+    The model of a seed after warm_up ticks under scen_dict; simulated once and shared through file_name
+    by all scenarios and workers
+    """
+    global _warm_state
+    if _warm_state[0] == file_name:
+        return _warm_state[1]
+    if os.path.exists(file_name):
+        model = BangladeshModel.load(file_name)
+    else:
+        model = BangladeshModel(seed=seed, scen_dict=scen_dict, engine=engine,
+                                common_random_numbers=common_random_numbers)
+        if sample_interval is not None:
+            model.sample_every(sample_interval, warm_up)
+        if trip_logs:
+            model.log_trips()
+        model.run(warm_up)
+        model.save(file_name)
+    _warm_state = (file_name, model)
+    return model
+
+# EOF -----------------------------------------------------------
@@ -1,4 +1,11 @@
 from model import BangladeshModel
+from network import load_network
+from run_control import ReplicationController, half_width
+from model_job import run_job, warm_up_job
+from result_cache import ResultCache
+from result_store import ResultStore
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
 import pandas as pd
 import os
 
@@ -10,7 +17,7 @@ output_directory = os.path.join(parent_directory, 'output')
 
 """
     Run simulation
-    Outputs several CSVs containing data of the runs
+    Outputs the data of the runs to the results.sqlite database (see ResultStore)
 """
 
 # ---------------------------------------------------------------
@@ -24,51 +31,247 @@ scen_list = [{"A":0, "B":0, "C":0, "D":0},{'A':0,'B':0,'C':0,'D':5},{'A':0,'B':0
 # seed_list is a list of seeds that are used in each scenario agai when running the model
 seed_list = [0, 1, 2,3,4,5,6,7,8,9]
 
-def run_model_batch(scen_list, seed_list):
+# the target relative half-width of the 95% confidence intervals of the Average Travel Time and the
+# Average Waiting Time over the seeds of a scenario; when set, the seeds of seed_list are used in order
+# until the target is reached, with at least min_replications and at most max_replications seeds
+# (seed_list is extended with the next seeds if it is shorter). None runs all seeds of seed_list
+target_half_width = None
+min_replications = 3
+max_replications = 30
+
+# the number of ticks of each run
+run_length = 7200
+
+# the target precision (relative half-width of the 95% confidence interval) of the steady-state averages;
+# when set, the warm-up is discarded and a run ends as soon as the target is reached, at most after run_length
+# ticks. None runs the full run_length and reports the averages over all trips
+target_precision = None
+
+# the number of worker processes; None uses all cores, 1 runs everything in this process
+workers = None
+
+# sample the vehicles in the system every sample_interval ticks into time_series_<scenario>_<seed> files; None for no samples
+sample_interval = None
+
+# log every trip and every delay at a bridge into trips_<scenario>_<seed>.npz files
+trip_logs = False
+
+# draw the demand, the broken bridges and the delays from separate random number streams, so a seed gives
+# the same demand in every scenario (common random numbers); False uses the single model.random stream
+common_random_numbers = False
+
+# reuse the results of runs that were done before with the same network, scenario, seed, run length, options and
+# simulation code (see ResultCache), so only the missing runs of a sweep are simulated. Not used with
+# sample_interval or trip_logs, whose files need the run itself
+use_cache = True
+
+# save each run to the cache folder every checkpoint_interval ticks; a run that was interrupted continues from
+# its last checkpoint when model_run.py is run again. None for no checkpoints
+checkpoint_interval = None
+
+# run a warm-up of warm_up ticks once per seed under the first scenario of scen_list, then fork the warmed-up
+# model into every scenario for the run_length measured ticks (see BangladeshModel.fork); the warm states are
+# kept in the cache folder. Best used with common_random_numbers, so the forks of a seed draw the same demand.
+# None starts every run from an empty network
+warm_up = None
+
+def load_worker_network():
+    """
+    Build the network once per worker process, all runs in the worker share it
+    """
+    load_network(BangladeshModel.file_name, BangladeshModel.roads)
+
+
+def run_model_batch(scen_list, seed_list, engine='agent', workers=1, run_length=7200, sample_interval=None,
+                    trip_logs=False, target_precision=None, target_half_width=None, min_replications=3,
+                    max_replications=30, common_random_numbers=False, use_cache=True, checkpoint_interval=None,
+                    warm_up=None):
     """
     Runs the model for each scenario, for each seed
+
+    engine is passed on to BangladeshModel; 'vector' gives the same results in a fraction of the time
+
+    The (scenario, seed) jobs are spread over a pool of workers processes (all cores if workers is None).
+    Every run only depends on its own seed, so the results do not depend on the number of workers.
+    With a target_precision, each run is controlled by a RunController: the warm-up is discarded,
+    the run stops once the steady-state averages are precise enough and the runs table also
+    reports the truncation point (Warm-up Tick) and the Run Length.
+
+    The data of each run is stored in the ResultStore results.sqlite in the output folder as soon as
+    the run finishes: one row per (scenario, seed) in the runs table, with the scenario parameters
+    as columns, and the delay counters per bridge in the bridges table. The averages per scenario
+    are stored in the scenarios table at the end. The rows of each call have their own batch id
+    (see ResultStore), so the runs of earlier batches are kept apart from this one.
+
+    With a target_half_width, the seeds of each scenario are scheduled one after the other (see
+    ReplicationController) until the confidence intervals of its averages are tight enough, so the
+    runs go to the scenarios with the most variance. The scenarios table reports the number of
+    replications and the half-widths of each scenario, and the used column of the runs table
+    which runs are in its averages.
+
+    With use_cache, the results of every run are stored in a ResultCache and runs that are
+    already in it are not run again, unless time series or trip logs are requested.
+    With a checkpoint_interval, every run is also saved every checkpoint_interval ticks, so a run
+    that was interrupted continues from its last checkpoint when the batch is run again.
+
+    With a warm_up, each seed is warmed up once for warm_up ticks under the first scenario of scen_list,
+    and every scenario is forked from that state and measured for run_length ticks, so the
+    scenarios of a seed are compared from the same loaded network. With workers, the warm-up of
+    a seed is one job of the pool and its forks are only submitted once its warm state is saved.
     """
-    # Collects the data per scenario, so it can be summarized to a 'final' df
-    averages_per_scenario = []
+    # The keys of the runs in the cache, also used to name their checkpoints
+    cache = ResultCache(BangladeshModel.file_name, BangladeshModel.roads)
+    use_cache = use_cache and sample_interval is None and not trip_logs
+
+    def cache_key(index, seed):
+        if warm_up is None:
+            return cache.key(scen_list[index], seed, run_length, engine, target_precision=target_precision,
+                             common_random_numbers=common_random_numbers)
+        return cache.key(scen_list[index], seed, run_length, engine, target_precision=target_precision,
+                         common_random_numbers=common_random_numbers, warm_up=warm_up,
+                         warm_up_scenario=scen_list[0])
+
+    def job(index, seed):
+        checkpoint_file = None
+        if checkpoint_interval is not None:
+            # the checkpoint also holds the time series and the trip log, if requested
+            checkpoint_file = cache.checkpoint_file_name(cache.key(
+                scen_list[index], seed, run_length, engine, target_precision=target_precision,
+                common_random_numbers=common_random_numbers, sample_interval=sample_interval, trip_logs=trip_logs,
+                warm_up=warm_up, warm_up_scenario=scen_list[0]))
+        return index, scen_list[index], seed, run_length, engine, sample_interval, trip_logs, target_precision, \
+            common_random_numbers, checkpoint_interval, checkpoint_file, warm_up, scen_list[0], \
+            warm_state_file(seed), output_directory
+
+    def warm_state_file(seed):
+        if warm_up is None:
+            return None
+        return cache.warm_state_file_name(cache.key(
+            scen_list[0], seed, warm_up, engine, common_random_numbers=common_random_numbers,
+            sample_interval=sample_interval, trip_logs=trip_logs))
+
+    # The seeds of each scenario; sequentially decided by a ReplicationController with a target_half_width
+    controllers = None
+    pending = deque()
+    if target_half_width is None:
+        seeds_per_scenario = [list(seed_list) for _ in scen_list]
+        if warm_up is None:
+            pending.extend(job(index, seed) for index in range(len(scen_list)) for seed in seed_list)
+        else:
+            # the scenarios of a seed after each other, so they are forked from the same warm state
+            pending.extend(job(index, seed) for seed in seed_list for index in range(len(scen_list)))
+    else:
+        seeds = list(seed_list)[:max_replications]
+        while len(seeds) < max_replications:
+            seeds.append(max(seeds, default=-1) + 1)
+        controllers = [ReplicationController(seeds, target_half_width, min_replications) for _ in scen_list]
+        seeds_per_scenario = [[] for _ in scen_list]
+        for index, controller in enumerate(controllers):
+            pending.extend(job(index, seed) for seed in controller.start())
+
+    # Collects the runs per scenario, by seed
+    runs_per_scenario = [{} for _ in scen_list]
+    results = ResultStore(os.path.join(output_directory, 'results.sqlite'))
+
+    def finish(index, seed, run_data, bridge_data):
+        print('Scenario:', index, 'Seed:', seed, 'done')
+        runs_per_scenario[index][seed] = run_data
+        results.add_run(cache_key(index, seed), index, seed, scen_list[index], run_length, engine, run_data,
+                        bridge_data)
+        if controllers is not None:
+            controller = controllers[index]
+            next_seeds = controller.add(seed, run_data.loc['Average Travel Time'].iloc[0],
+                                        run_data.loc['Average Waiting Time'].iloc[0])
+            pending.extend(job(index, next_seed) for next_seed in next_seeds)
+            seeds_per_scenario[index] = controller.used_seeds()
 
-    for index, scenario in enumerate(scen_list):
-        scen_data = pd.DataFrame()
-        print('Scenario:', index)
-        # Multiple runs per scenario for each seed
-        for i in seed_list:
-            print('Seed:', i)
-            seed = i
-            scen_dict = scenario
-            run_length = 7200
-            model = BangladeshModel(seed=seed, scen_dict=scen_dict)
-            for j in range(run_length):
-                model.step()
-            # Get data and add it to the dataframe
-            run_data = model.get_data()
-            scen_data = pd.concat([scen_data, run_data], axis=1)
-        # Output csv file with averages per model run of one scenario to output folder
-        filename = 'scenario_{}.csv'.format(index)
-        output_file_path = os.path.join(output_directory, filename)
-        scen_data.to_csv(output_file_path, index=True)
-
-        # Calculate the averages of one scenario across the different runs
+    def from_cache(index, seed):
+        """
+        Finish a job with its cached results, return whether they were found
+        """
+        if not use_cache:
+            return False
+        result = cache.get(cache_key(index, seed))
+        if result is None:
+            return False
+        print('Scenario:', index, 'Seed:', seed, 'found in cache')
+        finish(index, seed, *result)
+        return True
+
+    def store(index, seed, run_data, bridge_data):
+        if use_cache:
+            cache.put(cache_key(index, seed), (run_data, bridge_data))
+        finish(index, seed, run_data, bridge_data)
+
+    if workers == 1:
+        while pending:
+            args = pending.popleft()
+            if not from_cache(args[0], args[2]):
+                store(*run_job(*args))
+    else:
+        # Build the network before the pool is started, so forked workers inherit it
+        load_worker_network()
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_worker_network) as executor:
+            # the running jobs, with the seed of the warm-ups (None for a run)
+            futures = {}
+            # the runs of each seed that wait for its warm state
+            warming = {}
+            while pending or futures:
+                while pending:
+                    args = pending.popleft()
+                    index, seed = args[0], args[2]
+                    if from_cache(index, seed):
+                        continue
+                    if warm_up is not None and not os.path.exists(warm_state_file(seed)):
+                        # the warm state of a seed is simulated once, its forks start when it is saved
+                        if seed not in warming:
+                            warming[seed] = []
+                            futures[executor.submit(warm_up_job, seed, scen_list[0], warm_up, engine,
+                                                    sample_interval, trip_logs, common_random_numbers,
+                                                    warm_state_file(seed))] = seed
+                        warming[seed].append(args)
+                        continue
+                    futures[executor.submit(run_job, *args)] = None
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    seed = futures.pop(future)
+                    if seed is None:
+                        store(*future.result())
+                    else:
+                        future.result()
+                        pending.extend(warming.pop(seed))
+
+    # Calculate the averages of one scenario across the different runs
+    averages_per_scenario = []
+    for index, runs in enumerate(runs_per_scenario):
+        scen_data = pd.concat([runs[seed] for seed in seeds_per_scenario[index] if seed in runs], axis=1)
         scenario_averages = []
         scenario_averages.append(index)
         scenario_averages.append(scen_data.loc['Average Travel Time'].mean())
         scenario_averages.append(scen_data.loc['Average Waiting Time'].mean())
+        scenario_averages.append(len(scen_data.columns))
+        scenario_averages.append(half_width(scen_data.loc['Average Travel Time'].astype(float)))
+        scenario_averages.append(half_width(scen_data.loc['Average Waiting Time'].astype(float)))
         averages_per_scenario.append(scenario_averages)
 
-    # Outputs one CSV with the average per scenario for all scenarios
+    # Outputs one table with the average per scenario for all scenarios, with the scenario parameters
     df_all_scenarios = pd.DataFrame(averages_per_scenario)
-    df_all_scenarios = df_all_scenarios.rename(columns={0: 'Scenario', 1: 'Average Travel Time', 2: 'Average Waiting Time'})
-    filename = 'all_scenarios.csv'
-    output_file_path = os.path.join(output_directory, filename)
-    df_all_scenarios.to_csv(output_file_path, index=False)
-    print('Model runs done and averages per scenario saved to all_scenarios.csv in output folder')
-
-run_model_batch(scen_list=scen_list, seed_list=seed_list)
-
-
-
+    df_all_scenarios = df_all_scenarios.rename(columns={0: 'Scenario', 1: 'Average Travel Time', 2: 'Average Waiting Time',
+                                                        3: 'Replications', 4: 'Travel Time Half Width',
+                                                        5: 'Waiting Time Half Width'})
+    df_all_scenarios = pd.concat([df_all_scenarios, pd.DataFrame(scen_list)], axis=1)
+    for index, seeds in enumerate(seeds_per_scenario):
+        results.set_used(index, seeds)
+    results.put_scenarios(df_all_scenarios)
+    results.close()
+    print('Model runs done and averages per scenario saved to results.sqlite in output folder')
 
 
+if __name__ == '__main__':
+    run_model_batch(scen_list=scen_list, seed_list=seed_list, workers=workers, run_length=run_length,
+                    sample_interval=sample_interval, trip_logs=trip_logs, target_precision=target_precision,
+                    target_half_width=target_half_width, min_replications=min_replications,
+                    max_replications=max_replications, common_random_numbers=common_random_numbers,
+                    use_cache=use_cache, checkpoint_interval=checkpoint_interval, warm_up=warm_up)
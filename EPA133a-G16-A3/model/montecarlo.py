@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+from components import Source, delay_table
+from events import DiscreteEventVehicles
+from routes import Route
+from scenarios import BridgeFailureSampler
+
+
+# ---------------------------------------------------------------
+def delay_classes(lengths):
+    """
+    The delay class of Bridge.get_delay_time for each bridge length: the row of components.delay_table,
+    i.e. the number of class limits the length exceeds (unknown lengths are in class 0)
+    """
+    lengths = np.asarray(lengths, dtype=float)
+    classes = np.zeros(lengths.shape, dtype=np.int64)
+    for limit, _, _ in delay_table[:-1]:
+        classes += lengths > limit
+    return classes
+
+
+def _expected_delay(distribution, parameters):
+    if distribution == 'triangular':
+        # the mean of low, high and mode
+        return sum(parameters) / 3
+    low, high = parameters
+    return (low + high) / 2
+
+
+# the expected delay of each delay class: the means of the distributions of Bridge.get_delay_time
+expected_delays = np.array([_expected_delay(distribution, parameters) for _, distribution, parameters in delay_table])
+
+
+def draw_delays(classes, rng):
+    """
+    Draw one delay per entry of classes, from the distributions of Bridge.get_delay_time
+    """
+    classes = np.asarray(classes)
+    delays = np.empty(len(classes))
+    for delay_class, (_, distribution, parameters) in enumerate(delay_table):
+        selected = classes == delay_class
+        if distribution == 'triangular':
+            # Random.triangular takes (low, high, mode), NumPy (left, mode, right)
+            low, high, mode = parameters
+            delays[selected] = rng.triangular(low, mode, high, np.count_nonzero(selected))
+        else:
+            delays[selected] = getattr(rng, distribution)(*parameters, np.count_nonzero(selected))
+    return delays
+
+
+# ---------------------------------------------------------------
+class TripMonteCarlo:
+    """
+    Estimates the averages of a run by sampling trips directly, without simulating the network
+
+    Trucks never interact, so the travel time of a truck only depends on its route
+    and on the delays at the broken bridges on it. With the broken bridges known,
+    the ticks to drive from stop to stop of each route follow from the compiled
+    Route by the same rule as the event engine (DiscreteEventVehicles.drive_ticks).
+    A trip then takes those ticks plus ceil(delay) - 1 per broken bridge, and
+    it waits the sum of its delays. The trucks are generated on the schedule of
+    the sources, with a sink drawn uniformly from the reachable sinks as in
+    get_random_route. The delays are drawn in vectorized batches per scenario,
+    and only the trips that finish within the run length are counted.
+
+    The estimates match the simulator statistically, not run by run, since the
+    random numbers are drawn differently.
+
+    Attributes
+    __________
+    model: BangladeshModel
+        the model whose Infra and route table are used to compile the routes; its broken bridges are not used
+
+    routes: list
+        the compiled Route of every reachable source/sink pair
+
+    sources: list
+        one (generation_frequency, route numbers) tuple per source that can reach a sink
+
+    classes: ndarray (int)
+        the delay class of each bridge in model.bridges, see delay_classes
+    """
+
+    def __init__(self, model):
+        self.model = model
+        bridges = model.bridges
+        self.conditions = [bridge.condition for bridge in bridges]
+        self.classes = delay_classes([bridge.length for bridge in bridges])
+        bridge_number = {model.infra_index[bridge.unique_id]: number for number, bridge in enumerate(bridges)}
+
+        self.routes = []
+        # per route: the positions of the bridges along the route and their numbers in model.bridges
+        self._bridge_positions = []
+        self._bridge_numbers = []
+        self.sources = []
+        for source in (agent for agent in model.infra if isinstance(agent, Source)):
+            route_numbers = []
+            for sink in sorted(model.route_table.reachable_sinks(source.unique_id)):
+                route = Route(model, model.route_table.get(source.unique_id, sink))
+                if len(route) < 2:
+                    continue
+                positions = [position for position in route.stops if position != len(route) - 1]
+                route_numbers.append(len(self.routes))
+                self.routes.append(route)
+                self._bridge_positions.append(np.array(positions, dtype=np.int64))
+                self._bridge_numbers.append(np.array([bridge_number[route.indices[position]]
+                                                      for position in positions], dtype=np.int64))
+            if route_numbers:
+                self.sources.append((source.generation_frequency, np.array(route_numbers, dtype=np.int64)))
+
+    def route_ticks(self, route, broken_positions):
+        """
+        The number of ticks to drive a route, stopping at the broken bridges at broken_positions
+        """
+        offset = 0.0
+        total = 0
+        for stop in list(broken_positions) + [len(route) - 1]:
+            ticks, _ = DiscreteEventVehicles.drive_ticks(route, offset, stop)
+            total += ticks
+            # after the delay the truck drives on from the start of the bridge
+            offset = route.cum_start(stop)
+        return total
+
+    def sample(self, broken, run_length, rng):
+        """
+        Sample the trips of one run with the given broken bridges (a boolean array over model.bridges)
+
+        Returns the generated tick, route number, travel time and waiting time of each trip that finishes
+        within run_length ticks
+        """
+        broken = np.asarray(broken, dtype=bool)
+
+        # the driving ticks and the broken bridges of each route
+        base = np.empty(len(self.routes), dtype=np.int64)
+        broken_numbers = []
+        for number, route in enumerate(self.routes):
+            on_route = broken[self._bridge_numbers[number]]
+            base[number] = self.route_ticks(route, self._bridge_positions[number][on_route].tolist())
+            broken_numbers.append(self._bridge_numbers[number][on_route])
+        broken_counts = np.array([len(numbers) for numbers in broken_numbers], dtype=np.int64)
+        broken_start = np.cumsum(broken_counts) - broken_counts
+        broken_flat = np.concatenate(broken_numbers) if broken_numbers else np.zeros(0, dtype=np.int64)
+
+        # the trucks of each source, generated every generation_frequency ticks
+        generated = []
+        routes = []
+        for frequency, route_numbers in self.sources:
+            ticks = np.arange(0, run_length, frequency)
+            generated.append(ticks)
+            routes.append(route_numbers[rng.integers(len(route_numbers), size=len(ticks))])
+        generated = np.concatenate(generated)
+        routes = np.concatenate(routes)
+
+        # one delay for each broken bridge on the route of each trip
+        counts = broken_counts[routes]
+        total = int(counts.sum())
+        trips = np.repeat(np.arange(len(routes)), counts)
+        pair_start = np.repeat(broken_start[routes] - np.cumsum(counts) + counts, counts) + np.arange(total)
+        delays = draw_delays(self.classes[broken_flat[pair_start]], rng)
+
+        waiting_time = np.bincount(trips, weights=delays, minlength=len(routes))
+        travel_time = base[routes] + np.bincount(trips, weights=np.ceil(delays) - 1, minlength=len(routes))
+        travel_time = travel_time.astype(np.int64)
+
+        # a truck is counted when it reaches its sink in the last tick of the run at the latest
+        finished = generated + travel_time <= run_length - 1
+        return generated[finished], routes[finished], travel_time[finished], waiting_time[finished]
+
+    def estimate(self, scenario_dict, run_length=7200, replications=10, seed=None):
+        """
+        Estimate the averages of replications runs of a scenario,
+        with one column per replication in the format of BangladeshModel.get_data
+        """
+        rng = np.random.default_rng(seed)
+        data = {}
+        for replication in range(replications):
+            sampler = BridgeFailureSampler(self.conditions, rng)
+            _, _, travel_time, waiting_time = self.sample(sampler.broken(scenario_dict), run_length, rng)
+            data[str(replication)] = {'Average Travel Time': travel_time.mean(),
+                                      'Average Waiting Time': waiting_time.mean(),
+                                      'Trucks': len(travel_time)}
+        return pd.DataFrame(data)
+
+    def screen(self, scenario_list, run_length=7200, replications=10, seed=None):
+        """
+        Estimate the averages of every scenario of a list, as in all_scenarios.csv
+
+        Each replication breaks the bridges of all scenarios from the same failure ranks
+        (see BridgeFailureSampler), so the differences between the scenarios are not
+        blurred by different draws of the broken bridges.
+        """
+        rng = np.random.default_rng(seed)
+        travel_times = np.zeros((len(scenario_list), replications))
+        waiting_times = np.zeros((len(scenario_list), replications))
+        for replication in range(replications):
+            broken_matrix = BridgeFailureSampler(self.conditions, rng).broken_matrix(scenario_list)
+            for index, broken in enumerate(broken_matrix):
+                _, _, travel_time, waiting_time = self.sample(broken, run_length, rng)
+                travel_times[index, replication] = travel_time.mean()
+                waiting_times[index, replication] = waiting_time.mean()
+        return pd.DataFrame({'Scenario': np.arange(len(scenario_list)),
+                             'Average Travel Time': travel_times.mean(axis=1),
+                             'Average Waiting Time': waiting_times.mean(axis=1)})
+
+# EOF -----------------------------------------------------------
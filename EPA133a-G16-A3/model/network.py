@@ -0,0 +1,182 @@
+import os
+from types import MappingProxyType
+from functools import cached_property
+import numpy as np
+import pandas as pd
+import networkx as nx
+import matplotlib.pyplot as plt
+from routes import contract_graph, load_route_table, network_hash
+
+# Networks that are already loaded in this process, by network hash
+_networks = {}
+
+
+# ---------------------------------------------------------------
+class Network:
+    """
+    The road network of a csv file, built once and shared by many model runs
+
+    A Network is immutable, also in place: the arrays are read-only, positions is a
+    read-only mapping and bridges is a new DataFrame on every access. It holds
+    everything that only depends on the csv file, i.e. the parsed components, the
+    graph and positions, the bridge attributes and the route table. BangladeshModel
+    only adds the seed-dependent state, such as the broken-bridge flags and the delays.
+
+    Attributes
+    __________
+    file_name: str
+        the csv file the network is read from
+
+    key: str
+        hash of the csv file and the roads, see routes.network_hash
+
+    roads: tuple
+        the names of the roads in the network, discovered from the road column if not given
+
+    components: tuple
+        one (model_type, id, length, name, road, condition, lon, lat) tuple per Infra component,
+        in the order the agents are generated; an intersection shared by roads is only listed once
+
+    ids, road, lat, lon, length: ndarray
+        the columns of the rows of the selected roads, road by road in the order of the csv
+
+    graph: Graph
+        the network with one node per component and the lengths as edge weights,
+        built from the rows when it is first used
+
+    routing_graph: Graph
+        the graph with the chains of links contracted, see routes.contract_graph
+
+    positions: MappingProxyType
+        Key: id
+        Value: (lon, lat)
+
+    bridges: DataFrame
+        id, road, condition and length of each bridge, built from read-only arrays on every access
+
+    sources: tuple
+        the ids of all sources
+
+    sinks: tuple
+        the ids of all sinks
+
+    lat_min, lat_max, lon_min, lon_max: float
+        the bounds of the latitudes and longitudes
+
+    route_table: RouteTable
+        the shortest paths between all sources and sinks
+    """
+
+    def __init__(self, file_name, roads=None, key=None):
+        df = pd.read_csv(file_name)
+        self.file_name = file_name
+        self.key = key if key is not None else network_hash(file_name, roads)
+
+        # The roads are discovered from the road column, in the order they appear
+        road = df['road'].to_numpy(dtype=object)
+        if roads is None:
+            roads = pd.unique(road).tolist()
+        self.roads = tuple(roads)
+
+        # Group once: the rows of the selected roads, road by road, in the original order as in the csv
+        road_rank = pd.Series(road).map({name: rank for rank, name in enumerate(roads)}).to_numpy()
+        selected = np.flatnonzero(~np.isnan(road_rank))
+        rows = selected[np.argsort(road_rank[selected], kind='stable')]
+
+        road = road[rows]
+        ids = df['id'].to_numpy()[rows]
+        model_type = df['model_type'].str.strip().to_numpy(dtype=object)[rows]
+        name = df['name'].fillna('').str.strip().to_numpy(dtype=object)[rows]
+        condition = df['condition'].to_numpy(dtype=object)[rows]
+        lat = df['lat'].to_numpy(dtype=float)[rows]
+        lon = df['lon'].to_numpy(dtype=float)[rows]
+        length = df['length'].to_numpy(dtype=float)[rows]
+
+        self.lat_min, self.lat_max = lat.min(), lat.max()
+        self.lon_min, self.lon_max = lon.min(), lon.max()
+
+        # the same intersection on another road is the same component, only its first row generates an agent
+        _, first = np.unique(ids, return_index=True)
+        first.sort()
+        self.components = tuple(zip(model_type[first].tolist(), ids[first].tolist(), length[first].tolist(),
+                                    name[first].tolist(), road[first].tolist(), condition[first].tolist(),
+                                    lon[first].tolist(), lat[first].tolist()))
+
+        is_source = np.isin(model_type[first], ('source', 'sourcesink'))
+        is_sink = np.isin(model_type[first], ('sink', 'sourcesink'))
+        is_bridge = model_type[first] == 'bridge'
+        self.sources = tuple(ids[first][is_source].tolist())
+        self.sinks = tuple(ids[first][is_sink].tolist())
+        self._bridge_columns = {'id': _read_only(ids[first][is_bridge]), 'road': _read_only(road[first][is_bridge]),
+                                'condition': _read_only(condition[first][is_bridge]),
+                                'length': _read_only(length[first][is_bridge])}
+
+        # The rows, road by road; each row is connected to the next row on the same road
+        self.ids = _read_only(ids)
+        self.road = _read_only(road)
+        self.lat = _read_only(lat)
+        self.lon = _read_only(lon)
+        self.length = _read_only(length)
+        # a node shared by roads gets the position of its last row
+        self.positions = MappingProxyType(dict(zip(ids.tolist(), zip(lon.tolist(), lat.tolist()))))
+
+        self.routing_graph = nx.freeze(contract_graph(ids, road, length, ids[first][model_type[first] != 'link']))
+        self.route_table = load_route_table(file_name, self.routing_graph, self.sources, self.sinks, roads, key=self.key)
+
+        self._frozen = True
+
+    @property
+    def bridges(self):
+        """
+        The bridges as a DataFrame; a copy, so changing it does not change the shared network
+        """
+        return pd.DataFrame({column: values.copy() for column, values in self._bridge_columns.items()})
+
+    @cached_property
+    def graph(self):
+        """
+        The network with one node per id and the lengths as edge weights, built when it is first used
+        """
+        graph = nx.Graph()
+        graph.add_nodes_from((infra_id, {'pos': pos}) for infra_id, pos in self.positions.items())
+        # An edge from each row to the next row on the same road, with the length of the row as weight
+        same_road = self.road[1:] == self.road[:-1]
+        graph.add_weighted_edges_from(zip(self.ids[:-1][same_road].tolist(), self.ids[1:][same_road].tolist(),
+                                          self.length[:-1][same_road].tolist()))
+        return nx.freeze(graph)
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("Network is immutable, cannot set " + name)
+        super().__setattr__(name, value)
+
+    def __str__(self):
+        return "Network " + os.path.basename(self.file_name) + " (" + str(len(self.components)) + " components, " + \
+               str(len(self.roads)) + " roads)"
+
+    def draw(self):
+        """
+        Plot the graph of the network
+        """
+        nx.draw(self.graph, self.positions, with_labels=False, node_color='pink', node_size=5)
+        plt.show()
+
+
+# ---------------------------------------------------------------
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def load_network(file_name, roads=None):
+    """
+    Return the Network of a csv file, built at most once per process
+
+    roads is the list of roads to use from the file; all roads if None
+    """
+    key = network_hash(file_name, roads)
+    if key not in _networks:
+        _networks[key] = Network(file_name, roads, key)
+    return _networks[key]
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,119 @@
+import os
+import json
+import pickle
+import hashlib
+from functools import partial
+from atomic_file import atomic_write
+from network import load_network
+from routes import cache_directory
+
+# The modules whose code determines the results of a run; editing any of them invalidates the cached results
+simulation_modules = ('model', 'components', 'vectorized', 'events', 'scheduler', 'routes', 'network',
+                      'kpi', 'trip_log', 'scenarios', 'run_control', 'model_job')
+
+current_file_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------------------------
+def code_version(modules=simulation_modules, directory=current_file_directory):
+    """
+    Hash of the source code of the simulation modules
+    """
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(os.path.join(directory, module + '.py'), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+# ---------------------------------------------------------------
+class ResultCache:
+    """
+    Stores the results of finished runs on disk, by a hash of everything that determines them
+
+    The key of a run is a hash of the network (see routes.network_hash), the scenario
+    dict, the seed, the run length, the engine, the options that change the results
+    and the code version of the simulation modules. A run with the same key gives the
+    same results, so a hit can be returned instead of running it again; an edit of the
+    network csv or of the simulation code gives new keys, and the old results are
+    simply not found anymore.
+
+    Each result is one pickle file in directory, written to a temporary file first,
+    so an interrupted write never leaves a broken result behind. The checkpoints of
+    runs that are not finished yet (see BangladeshModel.checkpoint_every) are named
+    by the same key, in the checkpoints folder next to it, and so are the warmed-up
+    models of the seeds in the warm_states folder.
+
+    Attributes
+    __________
+    directory: str
+        the folder with one file per cached run
+
+    checkpoint_directory: str
+        the folder with the checkpoints of the runs that are not finished
+
+    warm_state_directory: str
+        the folder with the warmed-up models that the scenarios are forked from
+
+    network_key: str
+        the hash of the network csv file and the roads
+
+    version: str
+        the code version of the simulation modules, see code_version
+
+    hits, misses: int
+        the number of lookups that found and did not find a result
+    """
+
+    def __init__(self, file_name, roads=None, directory=os.path.join(cache_directory, 'results'),
+                 checkpoint_directory=os.path.join(cache_directory, 'checkpoints'),
+                 warm_state_directory=os.path.join(cache_directory, 'warm_states')):
+        self.directory = directory
+        self.checkpoint_directory = checkpoint_directory
+        self.warm_state_directory = warm_state_directory
+        self.network_key = load_network(file_name, roads).key
+        self.version = code_version()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, scen_dict, seed, run_length, engine='agent', **options):
+        """
+        The hash of a run; options are the further arguments that change its results
+        """
+        description = {'network': self.network_key, 'version': self.version, 'scenario': scen_dict,
+                       'seed': seed, 'run_length': run_length, 'engine': engine, 'options': options}
+        text = json.dumps(description, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def file_name(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def checkpoint_file_name(self, key):
+        os.makedirs(self.checkpoint_directory, exist_ok=True)
+        return os.path.join(self.checkpoint_directory, key + '.pkl')
+
+    def warm_state_file_name(self, key):
+        os.makedirs(self.warm_state_directory, exist_ok=True)
+        return os.path.join(self.warm_state_directory, key + '.pkl')
+
+    def get(self, key):
+        """
+        The stored results of a run, None if the run is not in the cache
+        """
+        try:
+            with open(self.file_name(key), 'rb') as file:
+                result = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        Store the results of a run
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.file_name(key), partial(pickle.dump, result, protocol=pickle.HIGHEST_PROTOCOL))
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,154 @@
+import sqlite3
+from datetime import datetime
+import pandas as pd
+
+
+# ---------------------------------------------------------------
+class ResultStore:
+    """
+    All results of the model runs in one SQLite database, one row per run
+
+    The runs table has one row per (scenario, seed) run: the batch, the scenario number,
+    the seed, the run length and the engine, the scenario parameters (the percentages of
+    scen_dict, one column per condition) and the data of BangladeshModel.get_data,
+    one column per row of it. The bridges table has the delay counters of
+    get_bridge_data, one row per run and bridge, and the scenarios table the averages
+    per scenario of the last batch, with its batch. A run is identified by its batch,
+    its scenario number and its key in the ResultCache, so a scenario that is listed
+    twice in a batch keeps its own runs; storing a run with the same identity replaces
+    it, any other run is appended, so the runs of earlier batches are kept. New columns
+    (a new condition, or the extra data of a RunController) are added when they first
+    appear. The used column of the runs tells whether a run counts in the averages of
+    the scenarios table (see set_used); a run that finished after a ReplicationController
+    stopped its scenario does not, and used is empty for the runs of a batch that did
+    not finish.
+
+    The batch is the time the store was opened (see new_batch), so the batches sort in
+    the order they were run. The runs can be read back filtered on any column, e.g.
+    store.runs(D=40) or store.runs(batch=store.latest_batch(), scenario=1,
+    columns=['seed', 'Average Travel Time']), without reading the other runs.
+
+    Attributes
+    __________
+    file_name: str
+        the SQLite database file
+
+    connection: Connection
+        the open connection to it
+
+    batch: str
+        the batch of the runs that are added
+    """
+
+    def __init__(self, file_name, batch=None):
+        self.file_name = file_name
+        self.batch = new_batch() if batch is None else batch
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS runs '
+                                '(batch TEXT, run_key TEXT, scenario INTEGER, seed INTEGER, used INTEGER, '
+                                'run_length INTEGER, engine TEXT, PRIMARY KEY (batch, scenario, run_key))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS runs_scenario ON runs (batch, scenario, seed)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS bridges (batch TEXT, scenario INTEGER, run_key TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS bridges_run ON bridges (batch, scenario, run_key)')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, run_key, scenario, seed, scen_dict, run_length, engine, run_data, bridge_data=None):
+        """
+        Store the data of one run (a get_data frame) and its delay counters per bridge (a get_bridge_data frame)
+        """
+        row = {'batch': self.batch, 'run_key': run_key, 'scenario': scenario, 'seed': seed, 'run_length': run_length, 'engine': engine}
+        row.update(scen_dict)
+        row.update(zip(run_data.index.tolist(), run_data.iloc[:, 0].tolist()))
+        self._insert('runs', list(row), [[_value(value) for value in row.values()]], replace=True)
+
+        if bridge_data is not None:
+            self.connection.execute('DELETE FROM bridges WHERE batch = ? AND scenario = ? AND run_key = ?',
+                                    (self.batch, scenario, run_key))
+            columns = ['batch', 'scenario', 'run_key'] + bridge_data.columns.tolist()
+            rows = [[self.batch, scenario, run_key] + [_value(value) for value in values] for values in bridge_data.values.tolist()]
+            self._insert('bridges', columns, rows)
+        self.connection.commit()
+
+    def set_used(self, scenario, seeds):
+        """
+        Mark the runs of a scenario of this batch with one of the seeds as used in its averages, the others as not
+        """
+        self.connection.execute('UPDATE runs SET used = seed IN ({}) WHERE batch = ? AND scenario = ?'.format(
+            ', '.join('?' * len(seeds))), [_value(seed) for seed in seeds] + [self.batch, scenario])
+        self.connection.commit()
+
+    def put_scenarios(self, df):
+        """
+        Store the averages per scenario of this batch, replacing those of the previous batch
+        """
+        df = df.assign(batch=self.batch)
+        df.to_sql('scenarios', self.connection, if_exists='replace', index=False)
+        self.connection.commit()
+
+    def runs(self, columns=None, **filters):
+        """
+        The runs with the given values in the columns of filters, e.g. runs(scenario=0, seed=3)
+        """
+        return self._select('runs', columns, filters)
+
+    def bridges(self, columns=None, **filters):
+        """
+        The delay counters per bridge of the runs, with their scenario and seed;
+        filters can be on the columns of the runs as well
+        """
+        if columns is None:
+            columns = ['bridges.*', 'seed']
+        return self._select('bridges JOIN runs USING (batch, scenario, run_key)', columns, filters)
+
+    def scenarios(self):
+        """
+        The averages per scenario of the last batch
+        """
+        return pd.read_sql_query('SELECT * FROM scenarios', self.connection)
+
+    def latest_batch(self):
+        """
+        The batch of the last runs that were added, None if there are no runs
+        """
+        return self.connection.execute('SELECT MAX(batch) FROM runs').fetchone()[0]
+
+    def _select(self, table, columns, filters):
+        selected = '*' if columns is None else ', '.join(column if column.endswith('.*') else _quote(column)
+                                                         for column in columns)
+        query = 'SELECT {} FROM {}'.format(selected, table)
+        if filters:
+            query += ' WHERE ' + ' AND '.join('{} = ?'.format(_quote(column)) for column in filters)
+        return pd.read_sql_query(query, self.connection, params=list(filters.values()))
+
+    def _insert(self, table, columns, rows, replace=False):
+        # add the columns that are not in the table yet
+        existing = {info[1] for info in self.connection.execute('PRAGMA table_info({})'.format(table))}
+        for column in columns:
+            if column not in existing:
+                self.connection.execute('ALTER TABLE {} ADD COLUMN {}'.format(table, _quote(column)))
+        query = 'INSERT {}INTO {} ({}) VALUES ({})'.format(
+            'OR REPLACE ' if replace else '', table, ', '.join(_quote(column) for column in columns),
+            ', '.join('?' * len(columns)))
+        self.connection.executemany(query, rows)
+
+
+# ---------------------------------------------------------------
+def new_batch():
+    """
+    A new batch id: the current time, which sorts in the order the batches were run
+    """
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _value(value):
+    # NumPy scalars as the Python values SQLite can store
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,295 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import networkx as nx
+from components import Sink, Bridge
+from atomic_file import atomic_write
+
+# Route tables are stored in the cache folder next to the model folder
+current_file_directory = os.path.dirname(os.path.abspath(__file__))
+parent_directory = os.path.abspath(os.path.join(current_file_directory, os.pardir))
+cache_directory = os.path.join(parent_directory, 'cache')
+
+# Route tables that are already loaded in this process, by network hash
+_route_tables = {}
+
+
+# ---------------------------------------------------------------
+class Route:
+    """
+    A route compiled into contiguous arrays
+
+    The route is compiled once, when BangladeshModel.get_random_route caches it.
+    A vehicle keeps its distance driven along the route and jumps straight to the
+    next bridge or sink with a bisect on cum_end, instead of walking link by link.
+
+    Attributes
+    __________
+    path_ids: Series
+        the Infras' unique IDs from the origin up to and including the first sink
+
+    infra: list
+        the Infra components along the route
+
+    indices: ndarray (int)
+        the index of each Infra in model.infra
+
+    cum_end: list (float)
+        the distance in meters from the start of the route to the end of each Infra
+
+    stops: list (int)
+        the positions in the route of the bridges and the sink, where a vehicle may have to stop
+
+    stop_indices: ndarray (int)
+        the index in model.infra of each stop
+    """
+
+    def __init__(self, model, path_ids):
+        infra = [model.infra[model.infra_index[infra_id]] for infra_id in path_ids]
+
+        # A vehicle is removed at the first sink after its origin
+        for position in range(1, len(infra)):
+            if isinstance(infra[position], Sink):
+                infra = infra[:position + 1]
+                break
+
+        self.path_ids = pd.Series([agent.unique_id for agent in infra])
+        self.infra = infra
+        self.indices = np.array([model.infra_index[agent.unique_id] for agent in infra], dtype=np.int64)
+        self.cum_end = np.cumsum([agent.length for agent in infra], dtype=float).tolist()
+        self.stops = [position for position in range(1, len(infra))
+                      if isinstance(infra[position], (Sink, Bridge))]
+        self.stop_indices = self.indices[self.stops]
+
+    def __len__(self):
+        return len(self.infra)
+
+    @property
+    def origin(self):
+        return self.path_ids.iloc[0]
+
+    @property
+    def destination(self):
+        return self.path_ids.iloc[-1]
+
+    def cum_start(self, position):
+        """
+        The distance from the start of the route to the start of the Infra at position
+        """
+        return self.cum_end[position - 1] if position > 0 else 0.0
+
+
+# ---------------------------------------------------------------
+class RouteTable:
+    """
+    The shortest paths (Infra component IDs) from every source to every sink
+
+    The table is built with one single-source search per source on the contracted
+    routing graph (see contract_graph), with the number of links as weight, which
+    gives the same paths as nx.shortest_path on the full graph. It is stored as flat
+    arrays: all contracted paths concatenated in nodes, and the start and end of the
+    path of each pair. A path is only expanded back to the full sequence of Infra
+    IDs when it is asked for. The connected components of the graph are computed
+    first, so only the sinks in the component of a source are considered. Pairs
+    without a path are not in the table, so the table is also the reachability index.
+
+    Attributes
+    __________
+    graph: Graph
+        the contracted routing graph
+
+    pairs: dict
+        Key: (source, sink)
+        Value: (start, end) of the contracted path in nodes
+
+    nodes: ndarray (int)
+        all contracted paths, concatenated
+    """
+
+    # Part of the cache key, change it when the stored format changes
+    version = 2
+
+    def __init__(self, graph, pairs, nodes):
+        self.graph = graph
+        self.pairs = pairs
+        self.nodes = nodes
+        self._expanded = {}
+
+        # The sinks that can be reached from each source
+        reachable = {}
+        for source, sink in pairs:
+            reachable.setdefault(source, set()).add(sink)
+        self._reachable = {source: frozenset(sinks) for source, sinks in reachable.items()}
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def reachable_sinks(self, source):
+        """
+        Return the set of sinks (other than the source itself) that can be reached from source
+        """
+        return self._reachable.get(source, frozenset())
+
+    def get(self, source, sink):
+        """
+        Return the path (Infra IDs) from source to sink, or None if there is no path
+        """
+        path = self._expanded.get((source, sink))
+        if path is None:
+            span = self.pairs.get((source, sink))
+            if span is None:
+                return None
+            path = expand_path(self.graph, self.nodes[span[0]:span[1]].tolist())
+            self._expanded[(source, sink)] = path
+        return path
+
+    @classmethod
+    def build(cls, graph, sources, sinks):
+        """
+        Compute the paths of all source/sink pairs with a single-source search per source
+        """
+        component_of = {}
+        for component, nodes in enumerate(nx.connected_components(graph)):
+            component_of.update(dict.fromkeys(nodes, component))
+        sinks_in_component = {}
+        for sink in sinks:
+            sinks_in_component.setdefault(component_of.get(sink), []).append(sink)
+
+        pairs = {}
+        paths = []
+        size = 0
+        for source in sources:
+            reachable = [sink for sink in sinks_in_component.get(component_of.get(source), []) if sink != source]
+            if not reachable:
+                continue
+            source_paths = nx.single_source_dijkstra_path(graph, source, weight='hops')
+            for sink in reachable:
+                path = source_paths[sink]
+                pairs[(int(source), int(sink))] = (size, size + len(path))
+                paths.append(path)
+                size += len(path)
+
+        nodes = np.fromiter((node for path in paths for node in path), dtype=np.int64, count=size)
+        return cls(graph, pairs, nodes)
+
+    def save(self, file_name):
+        """
+        Save the table as a compressed npz file; written to a temporary file first,
+        so a table that is being written is never loaded
+        """
+        pairs = np.array([key + span for key, span in self.pairs.items()], dtype=np.int64).reshape(-1, 4)
+        atomic_write(file_name, lambda file: np.savez_compressed(file, pairs=pairs, nodes=self.nodes))
+
+    @classmethod
+    def load(cls, file_name, graph):
+        with np.load(file_name) as data:
+            pairs = {(source, sink): (start, end) for source, sink, start, end in data['pairs'].tolist()}
+            return cls(graph, pairs, data['nodes'])
+
+
+# ---------------------------------------------------------------
+def contract_graph(ids, roads, lengths, keep):
+    """
+    Build the routing graph of a network, with the chains of links contracted into weighted super-edges
+
+    ids, roads and lengths are the rows of the network, road by road in order; each row
+    is connected to the next row on the same road. The ids in keep (intersections, sources,
+    sinks and bridges), the ends of each road and all ids that are not in a chain (degree
+    other than 2) stay nodes. Each chain of links between two of them becomes one edge with
+    attributes:
+
+    hops: the number of edges in the chain, the weight used for routing
+    length: the summed length of the rows in the chain
+    links: the IDs of the links in the chain, in order from the node start
+    start: one end of the edge
+
+    When two chains connect the same nodes, the one with the fewest hops is kept.
+    """
+    same_road = roads[1:] == roads[:-1]
+    first_rows = np.flatnonzero(same_road)
+    neighbors = ids[1:][same_road]
+    not_loop = ids[first_rows] != neighbors
+
+    # the degree of each id in the full graph, counting every edge once
+    pairs = np.unique(np.sort(np.column_stack((ids[first_rows][not_loop], neighbors[not_loop])), axis=1), axis=0)
+    nodes, degree = np.unique(pairs, return_counts=True)
+
+    road_end = np.ones(len(ids), dtype=bool)
+    road_end[1:-1] = ~same_road[1:] | ~same_road[:-1]
+    kept = np.isin(ids, list(keep)) | np.isin(ids, nodes[degree != 2]) | road_end | ~np.isin(ids, nodes)
+    kept_rows = np.flatnonzero(kept)
+
+    cumulative_length = np.concatenate(([0.0], np.cumsum(lengths))).tolist()
+    id_list = ids.tolist()
+    contracted = nx.Graph()
+    contracted.add_nodes_from(ids[kept_rows].tolist())
+    for row, next_row in zip(kept_rows[:-1].tolist(), kept_rows[1:].tolist()):
+        node, following = id_list[row], id_list[next_row]
+        if roads[row] != roads[next_row] or node == following:
+            # a loop back to the same node is never part of a shortest path
+            continue
+        hops = next_row - row
+        if contracted.has_edge(node, following) and contracted[node][following]['hops'] <= hops:
+            continue
+        contracted.add_edge(node, following, hops=hops,
+                            length=cumulative_length[next_row] - cumulative_length[row],
+                            links=id_list[row + 1:next_row], start=node)
+    return contracted
+
+
+def expand_path(contracted, path):
+    """
+    Expand a path in the contracted graph to the full sequence of IDs
+    """
+    expanded = [path[0]]
+    for node, following in zip(path, path[1:]):
+        edge = contracted[node][following]
+        if edge['start'] == node:
+            expanded.extend(edge['links'])
+        else:
+            expanded.extend(reversed(edge['links']))
+        expanded.append(following)
+    return expanded
+
+
+# ---------------------------------------------------------------
+def network_hash(file_name, roads=None):
+    """
+    Hash of the contents of the network csv file (and the roads used from it)
+    """
+    digest = hashlib.sha256()
+    digest.update(str(RouteTable.version).encode())
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    if roads is not None:
+        digest.update(','.join(roads).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_route_table(file_name, graph, sources, sinks, roads=None, directory=cache_directory, key=None):
+    """
+    Load the route table of a network from the cache folder,
+    build and save it first if the network has not been seen before
+
+    graph is the contracted routing graph of the network,
+    key is the network_hash of the file (computed if not given)
+    """
+    if key is None:
+        key = network_hash(file_name, roads)
+    if key in _route_tables:
+        return _route_tables[key]
+
+    table_file_name = os.path.join(directory, 'routes_' + key + '.npz')
+    if os.path.exists(table_file_name):
+        table = RouteTable.load(table_file_name, graph)
+    else:
+        table = RouteTable.build(graph, sources, sinks)
+        os.makedirs(directory, exist_ok=True)
+        table.save(table_file_name)
+
+    _route_tables[key] = table
+    return table
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,333 @@
+import numpy as np
+import pandas as pd
+from math import ceil
+from components import Vehicle
+from routes import Route
+from kpi import StreamingStatistics
+
+# Two-sided 95% quantiles of Student's t distribution, by degrees of freedom
+t_table = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+           10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110,
+           18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+           26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+
+# ---------------------------------------------------------------
+def t_quantile(degrees_of_freedom):
+    """
+    The two-sided 95% quantile of the t distribution; for degrees of freedom
+    between the rows of t_table the next lower row is used, which is conservative
+    """
+    if degrees_of_freedom < 1:
+        return np.inf
+    if degrees_of_freedom > 120:
+        return 1.960
+    return t_table[max(row for row in t_table if row <= degrees_of_freedom)]
+
+
+def half_width(values):
+    """
+    The half-width of the 95% confidence interval of the mean of independent values
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return np.inf
+    return t_quantile(len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values))
+
+
+def mser(values, batch_size=5):
+    """
+    The warm-up to truncate from a series with the MSER-5 rule (White, 1997)
+
+    The series is averaged in batches of batch_size; the truncation point is the
+    number of batches d (at most half of them) that minimises the marginal
+    standard error of the remaining batch means, sum((Z_i - mean(Z_d:))^2) / (n - d)^2.
+
+    Returns the number of observations to truncate and whether the minimum lies in the
+    first half of the batches, i.e. whether the warm-up appears to be over.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values) // batch_size
+    if n < 4:
+        return 0, False
+    batches = values[:n * batch_size].reshape(n, batch_size).mean(axis=1)
+
+    # the sums of the batches from d to the end, for every d
+    totals = np.cumsum(batches[::-1])[::-1]
+    squares = np.cumsum(batches[::-1] ** 2)[::-1]
+    count = np.arange(n, 0, -1)
+    statistic = (squares - totals ** 2 / count) / count ** 2
+
+    candidates = n // 2
+    d = int(np.argmin(statistic[:candidates + 1]))
+    return d * batch_size, d < candidates
+
+
+def longest_drive(model):
+    """
+    The number of ticks to drive the longest route of the model's route table, without delays
+    """
+    table = model.route_table
+    longest = 0.0
+    for source, sink in table.pairs:
+        route = Route(model, table.get(source, sink))
+        longest = max(longest, route.cum_start(len(route) - 1))
+    return ceil(longest / (Vehicle.speed * Vehicle.step_time))
+
+
+# ---------------------------------------------------------------
+class RunController:
+    """
+    Runs a model until its steady-state averages are precise enough
+
+    The model is run in steps of check_interval ticks. After each step the
+    warm-up is detected with MSER-5 on the travel times of the finished trips,
+    in the order they finished, and the trips of the warm-up are discarded.
+    The trips that finish in the first min_warm_up_ticks are always discarded:
+    the short routes finish first, so before the longest route has finished a
+    trip the travel times are biased downwards, which MSER-5 alone does not see.
+    The precision of the steady-state averages is the half-width of the 95%
+    confidence interval of the batch means of the remaining trips. The run ends
+    when the warm-up is over and both averages are within target_precision
+    (relative half-width), or at max_run_length.
+
+    Only the trips are truncated: the delay counters per bridge of the model
+    (BangladeshModel.get_bridge_data) still include the warm-up.
+
+    Attributes
+    __________
+    model: BangladeshModel
+        the model to run; its trip log is switched on
+
+    target_precision: float
+        the target half-width, relative to the average
+
+    check_interval: int
+        the number of ticks between two checks
+
+    min_run_length, max_run_length: int
+        the bounds of the run length in ticks
+
+    min_warm_up_ticks: int
+        the ticks after the start of the measurements that are always discarded;
+        by default the driving time of the longest route (see longest_drive)
+
+    batches: int
+        the number of batches for the confidence interval of the steady-state averages
+
+    warm_up_trips: int
+        the number of finished trips that are discarded
+
+    warm_up_tick: int
+        the tick in which the last discarded trip finished (0 if none are discarded)
+
+    run_length: int
+        the number of ticks the model has been run
+
+    converged: bool
+        whether the target precision was reached
+    """
+
+    def __init__(self, model, target_precision=0.05, check_interval=720, min_run_length=1440,
+                 max_run_length=7200, batches=20, min_warm_up_ticks=None):
+        self.model = model
+        self.target_precision = target_precision
+        self.check_interval = check_interval
+        self.min_run_length = min_run_length
+        self.max_run_length = max_run_length
+        self.batches = batches
+        self.min_warm_up_ticks = longest_drive(model) if min_warm_up_ticks is None else min_warm_up_ticks
+
+        if model.trip_log is None:
+            model.log_trips()
+        self.warm_up_trips = 0
+        self.warm_up_tick = 0
+        self.warm_up_over = False
+        self.travel_time_half_width = np.inf
+        self.waiting_time_half_width = np.inf
+        # a model that was restored from a checkpoint continues where it was
+        self.run_length = model.schedule.steps
+        self.converged = False
+
+    def run(self):
+        """
+        Run the model until the averages are precise enough or max_run_length is reached
+        """
+        while self.run_length < self.max_run_length:
+            # check at multiples of check_interval, also when continuing from a checkpoint
+            ticks = min(self.check_interval - self.run_length % self.check_interval,
+                        self.max_run_length - self.run_length)
+            self.model.run(ticks)
+            self.run_length += ticks
+            self.update()
+            if self.run_length >= self.min_run_length and self.converged:
+                break
+        return self
+
+    def steady_state(self):
+        """
+        The travel and waiting times of the finished trips after the warm-up
+        """
+        trips = self.model.trip_log.get_trips()[self.warm_up_trips:]
+        return trips['removed_at_step'] - trips['generated_at_step'], trips['waiting_time']
+
+    def update(self):
+        """
+        Detect the warm-up and compute the precision of the steady-state averages
+        """
+        trips = self.model.trip_log.get_trips()
+        travel_time = trips['removed_at_step'] - trips['generated_at_step']
+        # the trips are in the order they finished
+        skipped = int(np.searchsorted(trips['removed_at_step'], self.model.measured_from + self.min_warm_up_ticks,
+                                      side='right'))
+        truncated, self.warm_up_over = mser(travel_time[skipped:])
+        self.warm_up_trips = skipped + truncated
+        self.warm_up_tick = int(trips['removed_at_step'][self.warm_up_trips - 1]) if self.warm_up_trips else 0
+
+        travel_time, waiting_time = self.steady_state()
+        self.travel_time_half_width = self._batch_half_width(travel_time)
+        self.waiting_time_half_width = self._batch_half_width(waiting_time)
+        self.converged = self.warm_up_over and \
+            self.travel_time_half_width <= self.target_precision * abs(travel_time.mean()) and \
+            self.waiting_time_half_width <= self.target_precision * abs(waiting_time.mean())
+
+    def _batch_half_width(self, values):
+        size = len(values) // self.batches
+        if size == 0:
+            return np.inf
+        batch_means = values[:size * self.batches].reshape(self.batches, size).mean(axis=1)
+        return half_width(batch_means)
+
+    def get_data(self):
+        """
+        The steady-state data of the run, in the format of BangladeshModel.get_data,
+        with the truncation point, the run length and the precision
+        """
+        travel_time, waiting_time = self.steady_state()
+        travel_time_statistics = StreamingStatistics()
+        travel_time_statistics.add_many(travel_time.tolist())
+        waiting_time_statistics = StreamingStatistics()
+        waiting_time_statistics.add_many(waiting_time.tolist())
+
+        data_dict = {}
+        data_dict['Average Travel Time'] = travel_time_statistics.mean
+        data_dict['Average Waiting Time'] = waiting_time_statistics.mean
+        data_dict.update(travel_time_statistics.summary('Travel Time'))
+        data_dict.update(waiting_time_statistics.summary('Waiting Time'))
+        data_dict['Trucks'] = travel_time_statistics.count
+        data_dict['Warm-up Trips'] = self.warm_up_trips
+        data_dict['Warm-up Tick'] = self.warm_up_tick
+        data_dict['Run Length'] = self.run_length
+        data_dict['Travel Time Half Width'] = self.travel_time_half_width
+        data_dict['Waiting Time Half Width'] = self.waiting_time_half_width
+        data_dict['Converged'] = self.converged
+        return pd.DataFrame.from_dict(data_dict, orient='index', columns=[str(self.model._seed)])
+
+
+# ---------------------------------------------------------------
+class ReplicationController:
+    """
+    Decides how many replications (seeds) of one scenario are run
+
+    Seeds are used in the order of seeds. After min_replications, the 95%
+    confidence intervals of the Average Travel Time and the Average Waiting Time
+    over the replications are checked each time the next replication in seed order
+    has finished; the scenario is done at the first number of replications for
+    which both relative half-widths are within target_half_width, or when all
+    seeds are used. Replications that finish out of order are only counted once
+    all earlier seeds have finished, so the number of replications does not
+    depend on the order in which parallel runs finish.
+
+    Attributes
+    __________
+    seeds: list
+        the seeds that may be used, in order; their number is the maximum number of replications
+
+    target_half_width: float
+        the target half-width of the confidence intervals, relative to the averages
+
+    min_replications: int
+        the number of replications before the confidence intervals are checked
+
+    results: dict
+        Key: seed
+        Value: (Average Travel Time, Average Waiting Time) of the replication
+
+    replications: int
+        the number of replications used when done, otherwise None
+
+    submitted: int
+        the number of seeds handed out to run
+    """
+
+    def __init__(self, seeds, target_half_width, min_replications=3):
+        self.seeds = list(seeds)
+        self.target_half_width = target_half_width
+        self.min_replications = min(max(min_replications, 2), len(self.seeds))
+        self.results = {}
+        self.replications = None
+        self.submitted = 0
+        self._checked = self.min_replications - 1
+
+    @property
+    def done(self):
+        return self.replications is not None
+
+    def start(self):
+        """
+        The seeds to run first
+        """
+        self.submitted = self.min_replications
+        return self.seeds[:self.submitted]
+
+    def add(self, seed, travel_time, waiting_time):
+        """
+        Add the averages of a finished replication, return the seeds to run next
+        """
+        self.results[seed] = (travel_time, waiting_time)
+        if self.done:
+            return []
+
+        finished = 0
+        while finished < len(self.seeds) and self.seeds[finished] in self.results:
+            finished += 1
+        while self._checked < finished:
+            self._checked += 1
+            if self.precise(self._checked):
+                self.replications = self._checked
+                return []
+        if finished == len(self.seeds):
+            # the maximum number of replications is reached
+            self.replications = finished
+            return []
+
+        # run one more seed for each one that has finished
+        if self.submitted < len(self.seeds):
+            self.submitted += 1
+            return [self.seeds[self.submitted - 1]]
+        return []
+
+    def half_widths(self, replications):
+        """
+        The half-widths and the averages of the Average Travel Time and the Average Waiting Time
+        over the first replications seeds
+        """
+        values = np.array([self.results[seed] for seed in self.seeds[:replications]], dtype=float)
+        return half_width(values[:, 0]), half_width(values[:, 1]), values[:, 0].mean(), values[:, 1].mean()
+
+    def precise(self, replications):
+        travel_time_half_width, waiting_time_half_width, travel_time, waiting_time = \
+            self.half_widths(replications)
+        return travel_time_half_width <= self.target_half_width * abs(travel_time) and \
+            waiting_time_half_width <= self.target_half_width * abs(waiting_time)
+
+    def used_seeds(self):
+        """
+        The seeds of the replications that count: all of them once done,
+        otherwise the ones that have finished, in order
+        """
+        if self.done:
+            return self.seeds[:self.replications]
+        return [seed for seed in self.seeds if seed in self.results]
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+# ---------------------------------------------------------------
+class BridgeFailureSampler:
+    """
+    Draws which bridges are broken, for any number of scenarios at once
+
+    Every bridge gets one uniform random number; its failure rank is its position
+    among the bridges with the same condition, ordered by that number. A scenario
+    that breaks p percent of the n bridges of a condition breaks the bridges with
+    a rank below int(p / 100 * n), the same amount as BangladeshModel.break_bridges.
+    The broken sets are therefore nested: a bridge that is broken in a scenario is
+    also broken in every scenario with higher percentages.
+
+    Attributes
+    __________
+    conditions: ndarray
+        the condition of each bridge
+
+    ranks: ndarray (int)
+        the failure rank of each bridge among the bridges with the same condition
+
+    counts: dict
+        Key: condition
+        Value: the number of bridges with that condition
+    """
+
+    def __init__(self, conditions, rng):
+        self.conditions = np.asarray(conditions, dtype=object)
+        names, codes = np.unique(self.conditions.astype(str), return_inverse=True)
+        self._names = names.tolist()
+        self._codes = codes
+
+        uniforms = rng.random(len(codes))
+        # order by condition, then by the random number; the rank restarts at 0 for each condition
+        order = np.lexsort((uniforms, codes))
+        counts = np.bincount(codes, minlength=len(names))
+        starts = np.cumsum(counts) - counts
+        self.ranks = np.empty(len(codes), dtype=np.int64)
+        self.ranks[order] = np.arange(len(codes)) - starts[codes[order]]
+        self.counts = dict(zip(self._names, counts.tolist()))
+
+    def amounts(self, scenario_dict):
+        """
+        The number of bridges to break per condition (in the order of the condition codes)
+        """
+        return np.array([int((scenario_dict.get(name, 0) / 100) * self.counts[name]) for name in self._names],
+                        dtype=np.int64)
+
+    def broken(self, scenario_dict):
+        """
+        Which bridges are broken in a scenario, as a boolean array
+        """
+        return self.ranks < self.amounts(scenario_dict)[self._codes]
+
+    def broken_matrix(self, scenario_list):
+        """
+        Which bridges are broken in each scenario of a list, one row per scenario
+        """
+        amounts = np.array([self.amounts(scenario_dict) for scenario_dict in scenario_list],
+                           dtype=np.int64).reshape(-1, len(self._names))
+        return self.ranks[None, :] < amounts[:, self._codes]
+
+# EOF -----------------------------------------------------------
@@ -0,0 +1,87 @@
+from mesa.time import BaseScheduler
+from components import Infra, Source
+
+
+# ---------------------------------------------------------------
+class ActiveScheduler(BaseScheduler):
+    """
+    Scheduler that only steps the active agents
+
+    Infrastructure does nothing in Infra.step, so it is kept in a separate
+    registry that is only used for lookup. The active agents (sources and
+    vehicles) are stepped one at a time, in the order they were added,
+    like in the BaseScheduler. Adding and removing an agent are dict operations,
+    so the stream of trucks generated and removed costs O(1) per truck.
+
+    Attributes
+    __________
+    _infra: dict
+        Key: unique_id
+        Value: every Infra component, including the sources
+
+    _agents: dict
+        Key: unique_id
+        Value: the agents that are stepped (sources and vehicles)
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._infra = {}
+        self._source_count = 0
+
+    def add(self, agent):
+        """
+        Add an agent; Infra is registered for lookup, sources and vehicles are also stepped
+        """
+        if isinstance(agent, Infra):
+            if agent.unique_id in self._infra:
+                raise Exception(
+                    f"Agent with unique id {agent.unique_id!r} already added to scheduler"
+                )
+            self._infra[agent.unique_id] = agent
+            if not isinstance(agent, Source):
+                return
+            self._source_count += 1
+        super().add(agent)
+
+    def remove(self, agent):
+        """
+        Remove an agent from the registries it is in
+        """
+        self._agents.pop(agent.unique_id, None)
+        if isinstance(agent, Infra):
+            del self._infra[agent.unique_id]
+            if isinstance(agent, Source):
+                self._source_count -= 1
+
+    def get_agent(self, unique_id):
+        """
+        Look up an agent (Infra or active) by its unique_id
+        """
+        agent = self._infra.get(unique_id)
+        if agent is None:
+            agent = self._agents[unique_id]
+        return agent
+
+    def get_agent_count(self):
+        # The sources are in both registries
+        return len(self._infra) + len(self._agents) - self._source_count
+
+    def get_active_count(self):
+        """
+        The number of agents that are stepped
+        """
+        return len(self._agents)
+
+    def get_vehicles(self):
+        """
+        The active agents that are not Infra, i.e. the vehicles, in the order they were added
+        """
+        return [agent for agent in self._agents.values() if not isinstance(agent, Infra)]
+
+    @property
+    def agents(self):
+        # All Infra, followed by the vehicles, e.g. for the visualization
+        return list(self._infra.values()) + self.get_vehicles()
+
+# EOF -----------------------------------------------------------
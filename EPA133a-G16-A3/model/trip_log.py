@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# One record per truck that reached its sink
+trip_dtype = np.dtype([('truck', np.int64), ('source', np.int64), ('sink', np.int64),
+                       ('generated_at_step', np.int64), ('removed_at_step', np.int64),
+                       ('waiting_time', np.float64)])
+
+# One record per delay of a truck at a broken bridge
+wait_dtype = np.dtype([('truck', np.int64), ('bridge', np.int64), ('tick', np.int64), ('delay', np.float64)])
+
+
+# ---------------------------------------------------------------
+class TripLog:
+    """
+    Compact log of every trip, in fixed-dtype NumPy structured arrays
+
+    The arrays double in size when they are full, so an append is amortized O(1)
+    and no Python object is kept per trip. The waits are a separate array,
+    linked to the trips by the truck number: the order in which the trucks
+    are generated in the run.
+
+    Attributes
+    __________
+    trips: ndarray (trip_dtype)
+        truck, source, sink, generated_at_step, removed_at_step and waiting_time of each trip;
+        the used part is trips[:trip_count]
+
+    waits: ndarray (wait_dtype)
+        truck, bridge, tick and delay of each delay at a broken bridge;
+        the used part is waits[:wait_count]
+    """
+
+    def __init__(self, capacity=1024):
+        self.trips = np.zeros(capacity, dtype=trip_dtype)
+        self.trip_count = 0
+        self.waits = np.zeros(capacity, dtype=wait_dtype)
+        self.wait_count = 0
+
+    def __len__(self):
+        return self.trip_count
+
+    def append(self, truck, source, sink, generated_at_step, removed_at_step, waiting_time):
+        """
+        Log a trip that has reached its sink
+        """
+        if self.trip_count == len(self.trips):
+            self.trips = _double(self.trips)
+        self.trips[self.trip_count] = (truck, source, sink, generated_at_step, removed_at_step, waiting_time)
+        self.trip_count += 1
+
+    def wait(self, truck, bridge, tick, delay):
+        """
+        Log the delay of a truck at a bridge
+        """
+        if self.wait_count == len(self.waits):
+            self.waits = _double(self.waits)
+        self.waits[self.wait_count] = (truck, bridge, tick, delay)
+        self.wait_count += 1
+
+    def get_trips(self):
+        return self.trips[:self.trip_count]
+
+    def get_waits(self):
+        return self.waits[:self.wait_count]
+
+    def to_frames(self):
+        """
+        The trips and the waits as DataFrames
+        """
+        return pd.DataFrame(self.get_trips()), pd.DataFrame(self.get_waits())
+
+    def save(self, file_name):
+        """
+        Write the trips and the waits to an npz file
+        """
+        np.savez_compressed(file_name, trips=self.get_trips(), waits=self.get_waits())
+
+    @classmethod
+    def load(cls, file_name):
+        log = cls(capacity=1)
+        with np.load(file_name) as data:
+            log.trips = data['trips']
+            log.waits = data['waits']
+        log.trip_count = len(log.trips)
+        log.wait_count = len(log.waits)
+        return log
+
+
+# ---------------------------------------------------------------
+def _double(array):
+    grown = np.zeros(max(2 * len(array), 1), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+# EOF -----------------------------------------------------------
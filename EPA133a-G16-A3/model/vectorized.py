@@ -0,0 +1,349 @@
+import numpy as np
+from components import Sink, Bridge, Source, Vehicle
+
+
+# ---------------------------------------------------------------
+class VectorizedVehicles:
+    """
+    Array-backed vehicle engine
+
+    All live trucks are stored as a struct of NumPy arrays instead of one
+    Mesa agent per truck. A tick advances all of them in one batched update.
+    The vehicles drive the same compiled Routes by the same rules as in
+    Vehicle.step/drive/drive_to_next. The random numbers are drawn in the
+    same order as in the agent-based path (sources first, then the trucks in
+    the order they were generated), so the same seed gives the same
+    travel and waiting times.
+
+    Attributes
+    __________
+    location_index: ndarray (int)
+        a pointer to the current Infra in the compiled route of each vehicle
+
+    route_offset: ndarray (float)
+        the distance (in meters) driven from the start of the route
+
+    state: ndarray (int)
+        Vehicle.State value of each vehicle
+
+    waiting_time: ndarray (float)
+        the time each vehicle still needs to wait
+
+    waiting_time_agent: ndarray (float)
+        total waiting_time of each vehicle in the journey
+
+    travel_time: ndarray (int)
+        total travel_time of each vehicle
+
+    route_id: ndarray (int)
+        the compiled route of each vehicle
+
+    generated_at_step: ndarray (int)
+        the timestamp (number of ticks) that the vehicle is generated
+
+    number: ndarray (int)
+        the order in which each vehicle is generated in the run
+
+    count: int
+        the number of live vehicles, i.e. the used part of the arrays
+    """
+
+    # The number of route elements a vehicle looks ahead in one batched lookup;
+    # vehicles that pass more elements in one tick are handled one by one
+    window = 64
+
+    def __init__(self, model, capacity=1024):
+        self.model = model
+
+        # Infra agents are indexed by their position in model.infra
+        self.infra = model.infra
+        self.is_sink = np.array([isinstance(agent, Sink) for agent in self.infra])
+        self.sources = [agent for agent in self.infra if isinstance(agent, Source)]
+
+        # Compiled routes, concatenated in flat buffers
+        self.route_ids = {}
+        self.routes = []
+        self.route_start = []
+        self._flat_size = 0
+        self._flat_infra = np.zeros(capacity, dtype=np.int64)
+        self._flat_cum_end = np.full(capacity, np.inf)
+        self._flat_next_stop = np.zeros(capacity, dtype=np.int64)
+        # the number of bridges up to and including each position, over all routes,
+        # and the index in infra of each of those bridges, to count the crossings
+        self._flat_bridge_rank = np.zeros(capacity, dtype=np.int64)
+        self._bridge_count = 0
+        self._bridge_infra = np.zeros(capacity, dtype=np.int64)
+
+        # Struct of arrays with the live vehicles
+        self.count = 0
+        self.location_index = np.zeros(capacity, dtype=np.int64)
+        self.route_offset = np.zeros(capacity, dtype=float)
+        self.state = np.zeros(capacity, dtype=np.int64)
+        self.waiting_time = np.zeros(capacity, dtype=float)
+        self.waiting_time_agent = np.zeros(capacity, dtype=float)
+        self.travel_time = np.zeros(capacity, dtype=np.int64)
+        self.route_id = np.zeros(capacity, dtype=np.int64)
+        self.generated_at_step = np.zeros(capacity, dtype=np.int64)
+        self.number = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def compile_route(self, route):
+        """
+        Copy a compiled Route into the flat route buffers and return its route id
+
+        next_stop points to the first element at or after each position where
+        a vehicle has to stop: the sink or a broken bridge.
+        """
+        key = (route.origin, route.destination)
+        if key in self.route_ids:
+            return self.route_ids[key]
+
+        size = len(route)
+        next_stop = self._next_stops(route)
+
+        start = self._flat_size
+        self._reserve_flat(start + size + self.window)
+        self._flat_infra[start:start + size] = route.indices
+        self._flat_cum_end[start:start + size] = route.cum_end
+        self._flat_next_stop[start:start + size] = next_stop + start
+        bridges = [position for position in route.stops if position != size - 1]
+        is_bridge = np.zeros(size, dtype=np.int64)
+        is_bridge[bridges] = 1
+        self._flat_bridge_rank[start:start + size] = self._bridge_count + np.cumsum(is_bridge)
+        if self._bridge_count + len(bridges) > len(self._bridge_infra):
+            self._bridge_infra = _grow(self._bridge_infra,
+                                       max(2 * len(self._bridge_infra), self._bridge_count + len(bridges)), 0)
+        self._bridge_infra[self._bridge_count:self._bridge_count + len(bridges)] = route.indices[bridges]
+        self._bridge_count += len(bridges)
+        self._flat_size = start + size
+
+        route_id = len(self.route_start)
+        self.routes.append(route)
+        self.route_start.append(start)
+        self.route_ids[key] = route_id
+        return route_id
+
+    def refresh_stops(self):
+        """
+        Recompute next_stop of all compiled routes, after bridges have been broken or repaired
+        """
+        for route, start in zip(self.routes, self.route_start):
+            self._flat_next_stop[start:start + len(route)] = self._next_stops(route) + start
+
+    @staticmethod
+    def _next_stops(route):
+        size = len(route)
+        next_stop = np.full(size, size - 1, dtype=np.int64)
+        for position in reversed(route.stops):
+            if position == size - 1 or route.infra[position].broken:
+                next_stop[:position + 1] = position
+        return next_stop
+
+    def _reserve_flat(self, size):
+        capacity = len(self._flat_cum_end)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._flat_infra = _grow(self._flat_infra, capacity, 0)
+        self._flat_cum_end = _grow(self._flat_cum_end, capacity, np.inf)
+        self._flat_next_stop = _grow(self._flat_next_stop, capacity, 0)
+        self._flat_bridge_rank = _grow(self._flat_bridge_rank, capacity, 0)
+
+    def _reserve(self, size):
+        capacity = len(self.location_index)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self.location_index = _grow(self.location_index, capacity, 0)
+        self.route_offset = _grow(self.route_offset, capacity, 0)
+        self.state = _grow(self.state, capacity, 0)
+        self.waiting_time = _grow(self.waiting_time, capacity, 0)
+        self.waiting_time_agent = _grow(self.waiting_time_agent, capacity, 0)
+        self.travel_time = _grow(self.travel_time, capacity, 0)
+        self.route_id = _grow(self.route_id, capacity, 0)
+        self.generated_at_step = _grow(self.generated_at_step, capacity, 0)
+        self.number = _grow(self.number, capacity, 0)
+
+    def generate_truck(self, source):
+        """
+        Generates a truck at the given source, the array equivalent of Source.generate_truck
+        """
+        route = self.model.get_route(source.unique_id)
+        if len(route) < 2:
+            # No route to the sink, no truck
+            source.vehicle_generated_flag = False
+            return
+
+        route_id = self.compile_route(route)
+        self._reserve(self.count + 1)
+        i = self.count
+        # The global index of the first element of the route is kept in location_index
+        self.location_index[i] = self.route_start[route_id]
+        self.route_offset[i] = 0
+        self.state[i] = Vehicle.State.DRIVE.value
+        self.waiting_time[i] = 0
+        self.waiting_time_agent[i] = 0
+        self.travel_time[i] = 0
+        self.route_id[i] = route_id
+        self.generated_at_step[i] = self.model.schedule.steps
+        self.number[i] = self.model.trucks_generated
+        self.model.trucks_generated += 1
+        self.count += 1
+
+        Source.truck_counter += 1
+        source.vehicle_generated_flag = True
+
+    def step(self):
+        """
+        Advance the sources and all vehicles by one tick
+        """
+        steps = self.model.schedule.steps
+        # Trucks generated in this tick do not move until the next tick
+        count = self.count
+        for source in self.sources:
+            if steps % source.generation_frequency == 0:
+                self.generate_truck(source)
+            else:
+                source.vehicle_generated_flag = False
+
+        self.advance(count)
+
+        self.model.schedule.steps += 1
+        self.model.schedule.time += 1
+
+    def run_until(self, end):
+        """
+        Step until the schedule clock reaches end
+        """
+        while self.model.schedule.steps < end:
+            self.step()
+
+    def advance(self, count):
+        """
+        Let the first count vehicles wait or drive for one tick
+        """
+        if count == 0:
+            return
+
+        self.travel_time[:count] += 1
+
+        state = self.state[:count]
+        waiting = state == Vehicle.State.WAIT.value
+        waiting_time = self.waiting_time[:count]
+        waiting_time[waiting] = np.maximum(waiting_time[waiting] - 1, 0)
+        state[waiting & (waiting_time == 0)] = Vehicle.State.DRIVE.value
+
+        driving = np.flatnonzero(state == Vehicle.State.DRIVE.value)
+        if len(driving) == 0:
+            return
+
+        # the distance that vehicle drives in a tick
+        distance = Vehicle.speed * Vehicle.step_time
+        current = self.location_index[driving]
+        position = self.route_offset[driving] + distance
+        self.route_offset[driving] = position
+
+        # Vehicles that leave their current Infra
+        moving = position > self._flat_cum_end[current]
+        driving = driving[moving]
+        if len(driving) == 0:
+            return
+        current = current[moving]
+        position = position[moving]
+
+        # The element a vehicle ends up on is the first element ahead with a cum_end beyond the position
+        window = current[:, None] + 1 + np.arange(self.window)
+        ahead = self._flat_cum_end[window] > position[:, None]
+        beyond = ~ahead.any(axis=1)
+        reached = np.where(beyond, window[:, -1] + 1, current + 1 + np.argmax(ahead, axis=1))
+
+        # A vehicle that passes a stop ends its tick there
+        stop = self._flat_next_stop[current + 1]
+        for row in np.flatnonzero(beyond & (stop > reached)):
+            reached[row] = self._find(reached[row], stop[row], position[row])
+        stopped = stop <= reached
+        reached = np.where(stopped, stop, reached)
+        self.location_index[driving] = reached
+        self.count_crossings(current, reached)
+
+        stopped_at = stop[stopped]
+        stopped = driving[stopped]
+        at_sink = self.is_sink[self._flat_infra[stopped_at]]
+
+        # Broken bridges: draw the delay in the order of the vehicles, as the agents would
+        bridges = stopped[~at_sink]
+        for i, flat_index in zip(bridges, stopped_at[~at_sink]):
+            bridge = self.infra[self._flat_infra[flat_index]]
+            delay_time = Bridge.get_delay_time(bridge)
+            self.waiting_time[i] = delay_time
+            self.waiting_time_agent[i] += delay_time
+            self.model.record_wait(self.number[i], self._flat_infra[flat_index], delay_time)
+            self.state[i] = Vehicle.State.WAIT.value
+            # arrive at the bridge, offset 0
+            self.route_offset[i] = self._flat_cum_end[flat_index - 1]
+
+        finished = stopped[at_sink]
+        if len(finished) > 0:
+            routes = self.routes
+            for number, route_id, travel_time, waiting_time in zip(
+                    self.number[finished].tolist(), self.route_id[finished].tolist(),
+                    self.travel_time[finished].tolist(), self.waiting_time_agent[finished].tolist()):
+                self.model.record_trip(number, routes[route_id], travel_time, waiting_time)
+            self.remove(finished)
+
+    def count_crossings(self, current, reached):
+        """
+        Count the bridges the vehicles cross from current up to and including reached (flat positions)
+        """
+        first = self._flat_bridge_rank[current]
+        counts = self._flat_bridge_rank[reached] - first
+        total = int(counts.sum())
+        if total == 0:
+            return
+        # the numbers of the crossed bridges, first up to first + count for each vehicle
+        ends = np.cumsum(counts)
+        bridge_numbers = np.repeat(first - ends + counts, counts) + np.arange(total)
+        self.model.bridge_delays.cross_many(self._bridge_infra[bridge_numbers])
+
+    def waiting_count(self):
+        """
+        The number of vehicles currently waiting at a bridge
+        """
+        return int(np.count_nonzero(self.state[:self.count] == Vehicle.State.WAIT.value))
+
+    def _find(self, start, stop, position):
+        """
+        Return the first element from start up to stop with a cum_end beyond position
+        """
+        return start + np.searchsorted(self._flat_cum_end[start:stop + 1], position, side='right')
+
+    def remove(self, indices):
+        """
+        Remove the given vehicles, keeping the others in the order they were generated
+        """
+        keep = np.ones(self.count, dtype=bool)
+        keep[indices] = False
+        count = int(keep.sum())
+        for array in (self.location_index, self.route_offset, self.state, self.waiting_time,
+                      self.waiting_time_agent, self.travel_time, self.route_id, self.generated_at_step, self.number):
+            array[:count] = array[:self.count][keep]
+        self.count = count
+
+    def vehicle_counts(self):
+        """
+        The number of vehicles currently on each Infra (in the order of self.infra)
+        """
+        return np.bincount(self._flat_infra[self.location_index[:self.count]], minlength=len(self.infra))
+
+
+# ---------------------------------------------------------------
+def _grow(array, capacity, fill):
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+# EOF -----------------------------------------------------------